@@ -0,0 +1,185 @@
+# backend/core/agent_middleware.py
+# Agent middleware: tool prefetch overlapping the first model call, and per-tool timeouts.
+
+import asyncio
+import contextvars
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait as wait_futures
+from typing import NotRequired
+
+from langchain.agents.middleware import AgentMiddleware, AgentState
+from langchain_core.messages import HumanMessage, SystemMessage, ToolMessage
+
+from backend.core.cache import TTLLRUCache
+from backend.core.sandbox_pool import SANDBOX_TIMEOUT_S, SANDBOX_QUEUE_TIMEOUT
+from backend.core.tracing import METRICS, span
+
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "1") == "1"
+PREFETCH_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PREFETCH_WORKERS", "4")),
+    thread_name_prefix="prefetch",
+)
+# How long the first model call waits for a prefetched result to offer; later calls only take what is ready
+PREFETCH_WAIT_S = float(os.getenv("PREFETCH_WAIT_S", "0.3"))
+
+# Seconds a single tool call may take before the model gets a TOOL_TIMEOUT result instead.
+# execute_python is bounded by the sandbox's own queue wait and run timeout, plus a margin.
+TOOL_TIMEOUT_S = float(os.getenv("TOOL_TIMEOUT_S", "30"))
+MEMORY_TIMEOUT_S = float(os.getenv("MEMORY_TIMEOUT_S", "10"))
+TOOL_TIMEOUTS = {
+    "search_documents": float(os.getenv("SEARCH_TIMEOUT_S", "20")),
+    "get_memory": MEMORY_TIMEOUT_S,
+    "save_memory": MEMORY_TIMEOUT_S,
+    "execute_python": float(os.getenv("EXECUTE_PYTHON_TIMEOUT_S", str(SANDBOX_QUEUE_TIMEOUT + SANDBOX_TIMEOUT_S + 5))),
+}
+# Sync agent runs (agent.invoke) enforce timeouts by running the tool on this pool
+_TIMEOUT_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("TOOL_TIMEOUT_WORKERS", "8")),
+    thread_name_prefix="tool-timeout",
+)
+
+METRICS.describe("rag_tool_timeouts_total", "Tool calls abandoned after exceeding their timeout.")
+METRICS.describe("rag_prefetch_total", "Tool results prefetched alongside the first model call.")
+METRICS.describe("rag_prefetch_offered_total", "Prefetched results handed to the model as context.")
+
+# Prefetches of the agent runs in progress, by the run's prefetch_id. after_agent removes them; the TTL
+# drops those of runs that raised or were cancelled before reaching it
+_runs = TTLLRUCache(maxsize=1024, ttl=float(os.getenv("PREFETCH_RUN_TTL_S", "300")))
+
+
+def _last_user_message(messages: list):
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage):
+            return message.content if isinstance(message.content, str) else None
+    return None
+
+
+class PrefetchState(AgentState):
+    prefetch_id: NotRequired[str]
+
+
+class PrefetchMiddleware(AgentMiddleware):
+    """
+    Starts `prefetchers` (name -> fn(user_message, first_turn)) in the background before the first model call,
+    so memory and retrieval run while the model is still deciding to ask for them.
+    A prefetcher that returns text has it offered to the model as a system message (at most once per run, and
+    not after the model has called that tool itself); the model may use it or call the tool with its own arguments.
+    One that returns "" only warmed the session cache the matching tool reads; None means it chose not to run.
+    """
+
+    state_schema = PrefetchState
+
+    def __init__(self, prefetchers: dict):
+        super().__init__()
+        self.prefetchers = prefetchers
+
+    def before_agent(self, state, runtime):
+        if not PREFETCH_ENABLED:
+            return None
+        message = _last_user_message(state["messages"])
+        if not message:
+            return None
+        first_turn = sum(isinstance(m, HumanMessage) for m in state["messages"]) == 1
+        run_id = uuid.uuid4().hex
+        # Copied context: the tools read the current session, user and trace from context vars
+        _runs.set(run_id, {
+            name: PREFETCH_EXECUTOR.submit(contextvars.copy_context().run, self._run, name, prefetch, message, first_turn)
+            for name, prefetch in self.prefetchers.items()
+        })
+        return {"prefetch_id": run_id}
+
+    def before_model(self, state, runtime):
+        pending = self._pending(state)
+        if pending is None:
+            return None
+        futures, first_call = pending
+        if first_call:
+            wait_futures(futures.values(), timeout=PREFETCH_WAIT_S)
+        return self._offer(futures)
+
+    async def abefore_model(self, state, runtime):
+        # Async runs (/api/chat, /api/chat/stream) wait without blocking the event loop for other requests
+        pending = self._pending(state)
+        if pending is None:
+            return None
+        futures, first_call = pending
+        if first_call:
+            await asyncio.wait([asyncio.wrap_future(future) for future in futures.values()], timeout=PREFETCH_WAIT_S)
+        return self._offer(futures)
+
+    def after_agent(self, state, runtime):
+        _runs.pop(state.get("prefetch_id"))
+        return None
+
+    @staticmethod
+    def _pending(state):
+        """(prefetches not offered yet, whether this is the run's first model call), or None if there are none."""
+        futures = _runs.get(state.get("prefetch_id"))
+        if not futures:
+            return None
+        called = {m.name for m in state["messages"] if isinstance(m, ToolMessage)}
+        for name in called:
+            futures.pop(name, None)
+        first_call = not called and not any(getattr(m, "tool_calls", None) for m in state["messages"])
+        return futures, first_call
+
+    @staticmethod
+    def _offer(futures: dict):
+        """Offers the prefetches that have finished; the rest stay for a later model call."""
+        offers = []
+        for name, future in list(futures.items()):
+            if not future.done():
+                continue
+            futures.pop(name)
+            result = future.result()
+            if result:
+                METRICS.inc("rag_prefetch_offered_total", tool=name)
+                offers.append(SystemMessage(content=result))
+        return {"messages": offers} if offers else None
+
+    @staticmethod
+    def _run(name, prefetch, message, first_turn):
+        try:
+            with span(f"prefetch.{name}"):
+                result = prefetch(message, first_turn)
+            if result is not None:
+                METRICS.inc("rag_prefetch_total", tool=name)
+            return result
+        except Exception as e:
+            print(f"[prefetch] {name} failed: {e}")
+            return None
+
+
+def _timeout_message(request, timeout: float) -> ToolMessage:
+    name = request.tool_call["name"]
+    METRICS.inc("rag_tool_timeouts_total", tool=name)
+    return ToolMessage(
+        content=f"TOOL_TIMEOUT: `{name}` did not finish within {timeout:g}s. Answer with what you have, or say the lookup timed out.",
+        tool_call_id=request.tool_call["id"],
+        name=name,
+        status="error",
+    )
+
+
+class ToolTimeoutMiddleware(AgentMiddleware):
+    """
+    Bounds each tool call by TOOL_TIMEOUTS (TOOL_TIMEOUT_S for others). Tool calls from one model step
+    already run concurrently, so this keeps one slow call from holding back the step's other results.
+    An abandoned sync tool keeps running in its thread until it returns; its result is discarded.
+    """
+
+    def wrap_tool_call(self, request, handler):
+        timeout = TOOL_TIMEOUTS.get(request.tool_call["name"], TOOL_TIMEOUT_S)
+        future = _TIMEOUT_EXECUTOR.submit(contextvars.copy_context().run, handler, request)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            return _timeout_message(request, timeout)
+
+    async def awrap_tool_call(self, request, handler):
+        timeout = TOOL_TIMEOUTS.get(request.tool_call["name"], TOOL_TIMEOUT_S)
+        try:
+            return await asyncio.wait_for(handler(request), timeout=timeout)
+        except asyncio.TimeoutError:
+            return _timeout_message(request, timeout)
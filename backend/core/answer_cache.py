@@ -0,0 +1,132 @@
+# backend/core/answer_cache.py
+# Opt-in semantic cache of final chat answers, matched by MiniLM similarity of the incoming message.
+
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+from backend.core.streaming import extract_citations
+from backend.ingest.manifest import get_manifest
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "0") == "1"
+# Cosine similarity between messages above which a stored answer is reused
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_TTL_S = float(os.getenv("ANSWER_CACHE_TTL_S", "86400"))
+
+
+class SemanticAnswerCache:
+    """
+    Answers keyed by message embedding, per user (answers can depend on that user's memory).
+    Only answers that cite documents are stored. An entry is served only while:
+      - every cited source still has the file hash it had when the answer was produced (re-ingest invalidates),
+      - the user's and company memory files are unchanged,
+      - it is younger than ANSWER_CACHE_TTL_S.
+    """
+
+    def __init__(self, maxsize: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL_S, threshold: float = ANSWER_CACHE_THRESHOLD):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stores = 0
+        self.latency_saved_s = 0.0
+
+    @staticmethod
+    def _source_hashes(sources: set) -> dict:
+        manifest = get_manifest()
+        return {source: manifest.file_hash(source) for source in sources}
+
+    def _valid(self, entry: dict, memory_signature) -> bool:
+        if time.time() - entry["created_at"] > self.ttl or entry["memory_signature"] != memory_signature:
+            return False
+        return self._source_hashes(set(entry["source_hashes"])) == entry["source_hashes"]
+
+    def lookup(self, user_id: str, embedding, memory_signature):
+        """Best stored answer for this user above the similarity threshold, or None. Stale matches are evicted."""
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        with self._lock:
+            candidates = [(key, entry) for key, entry in self._entries.items() if entry["user_id"] == user_id]
+        if candidates:
+            similarities = np.stack([entry["embedding"] for _, entry in candidates]) @ query
+            for i in np.argsort(-similarities):
+                if similarities[i] < self.threshold:
+                    break
+                key, entry = candidates[i]
+                if not self._valid(entry, memory_signature):
+                    with self._lock:
+                        if self._entries.pop(key, None) is not None:
+                            self.invalidations += 1
+                    continue
+                with self._lock:
+                    self.hits += 1
+                    self.latency_saved_s += entry["latency_s"]
+                    if key in self._entries:
+                        self._entries.move_to_end(key)
+                return {"reply": entry["reply"], "similarity": round(float(similarities[i]), 4), "matched": entry["message"]}
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def store(self, user_id: str, message: str, embedding, reply: str, memory_signature, latency_s: float) -> bool:
+        sources = {citation["source"] for citation in extract_citations(reply)}
+        if not sources:
+            # Not grounded in documents (or a NOT_FOUND answer): nothing to invalidate it by, so don't keep it
+            return False
+        vector = np.asarray(embedding, dtype=np.float32)
+        entry = {
+            "user_id": user_id,
+            "message": message,
+            "embedding": vector / max(float(np.linalg.norm(vector)), 1e-12),
+            "reply": reply,
+            "source_hashes": self._source_hashes(sources),
+            "memory_signature": memory_signature,
+            "latency_s": latency_s,
+            "created_at": time.time(),
+        }
+        with self._lock:
+            self._next_id += 1
+            self._entries[self._next_id] = entry
+            self.stores += 1
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": ANSWER_CACHE_ENABLED,
+            "threshold": self.threshold,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "stores": self.stores,
+            "invalidations": self.invalidations,
+            "latency_saved_s": round(self.latency_saved_s, 3),
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> SemanticAnswerCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SemanticAnswerCache()
+        return _cache
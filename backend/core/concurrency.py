@@ -0,0 +1,102 @@
+# backend/core/concurrency.py
+# Per-endpoint admission control and the executors that keep blocking work off the event loop.
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from fastapi import HTTPException
+
+# Parsing and embedding are CPU-bound but release the GIL in PyMuPDF/torch, so threads are enough here
+INGEST_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("INGEST_WORKERS", str(min(4, os.cpu_count() or 1)))),
+    thread_name_prefix="ingest",
+)
+
+
+async def run_blocking(executor, fn, *args, **kwargs):
+    """Runs a synchronous function on `executor` without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(fn, *args, **kwargs))
+
+
+class EndpointLimiter:
+    """
+    Caps in-flight requests for one endpoint and queues a bounded number behind them.
+    When the queue is full, or a queued request waits longer than `queue_timeout`,
+    the request is rejected with 429 and a Retry-After hint instead of piling up.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, queue_timeout: float = 30.0, retry_after: int = 5):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    def _reject(self, reason: str):
+        self.rejected += 1
+        raise HTTPException(
+            status_code=429,
+            detail=f"{self.name} is at capacity ({reason}). Please retry shortly.",
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+    async def acquire(self) -> None:
+        if self.waiting >= self.max_queue and self._semaphore.locked():
+            self._reject("queue full")
+        self.waiting += 1
+        acquired = False
+        try:
+            async with asyncio.timeout(self.queue_timeout):
+                await self._semaphore.acquire()
+                acquired = True
+        except TimeoutError:
+            # The deadline can pass just after the permit was granted; hand it back rather than leak it
+            if acquired:
+                self._semaphore.release()
+            self._reject("queue timeout")
+        finally:
+            self.waiting -= 1
+        self.active += 1
+
+    def release(self) -> None:
+        self.active -= 1
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+        }
+
+
+chat_limiter = EndpointLimiter(
+    "chat",
+    max_concurrent=int(os.getenv("CHAT_MAX_CONCURRENCY", "8")),
+    max_queue=int(os.getenv("CHAT_MAX_QUEUE", "16")),
+    queue_timeout=float(os.getenv("CHAT_QUEUE_TIMEOUT", "30")),
+)
+ingest_limiter = EndpointLimiter(
+    "ingest",
+    max_concurrent=int(os.getenv("INGEST_MAX_CONCURRENCY", "2")),
+    max_queue=int(os.getenv("INGEST_MAX_QUEUE", "4")),
+    queue_timeout=float(os.getenv("INGEST_QUEUE_TIMEOUT", "60")),
+    retry_after=15,
+)
@@ -0,0 +1,118 @@
+# backend/core/context_assembly.py
+# Packs retrieved chunks into a token-budgeted context: neighbours merged, duplicates dropped, best first.
+
+import math
+import os
+import re
+
+# Upper bound on the retrieved context handed to the model per search (estimated tokens)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+# A block that would overflow the budget is cut at a sentence boundary if at least this many tokens still fit
+MIN_PARTIAL_TOKENS = 60
+# Longest overlap searched when stitching neighbouring chunks (the splitter overlaps by 100 chars)
+MAX_OVERLAP_CHARS = 200
+# Shorter matches are coincidences ("...in 2023" / "3 new regions"), not splitter overlap, and must not drop text
+MIN_OVERLAP_CHARS = 20
+
+_CHUNK_INDEX = re.compile(r"_chunk_(\d+)$")
+_SENTENCE_END = re.compile(r"[.!?](\s|$)")
+
+
+def estimate_tokens(text: str) -> int:
+    """~4 characters per token for English prose; close enough to budget without loading a tokenizer."""
+    return math.ceil(len(text) / 4)
+
+
+def chunk_index(chunk_id: str):
+    match = _CHUNK_INDEX.search(chunk_id or "")
+    return int(match.group(1)) if match else None
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def stitch(left: str, right: str) -> str:
+    """Joins consecutive chunks, dropping the text the splitter repeated at the start of `right`."""
+    for size in range(min(len(left), len(right), MAX_OVERLAP_CHARS), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return left + right[size:]
+    return left + "\n" + right
+
+
+def _truncate(text: str, tokens: int) -> tuple:
+    """(text cut to about `tokens` at a sentence boundary, number of characters of `text` kept)."""
+    limit = tokens * 4
+    if len(text) <= limit:
+        return text, len(text)
+    cut = text[:limit]
+    ends = [match.end() for match in _SENTENCE_END.finditer(cut)]
+    kept = (cut[:ends[-1]] if ends else cut).rstrip()
+    return kept + " [...]", len(kept)
+
+
+def merge_neighbours(docs: list) -> list:
+    """
+    Groups ranked documents into blocks of consecutive chunks from the same source.
+    Each block is {"source", "chunk_ids", "starts", "text", "rank"}: starts[i] is the offset in text where
+    chunk_ids[i] begins contributing new text, and rank is the best rank of its members.
+    """
+    by_position = {}
+    for rank, doc in enumerate(docs):
+        source = doc.metadata.get("source", "Unknown_File")
+        chunk_id = doc.metadata.get("chunk_id", "Unknown_Chunk")
+        by_position.setdefault((source, chunk_index(chunk_id), chunk_id), (rank, doc.page_content))
+
+    blocks = []
+    for (source, index, chunk_id), (rank, text) in sorted(by_position.items(), key=lambda item: (item[0][0], item[0][1] is None, item[0][1] or 0, item[0][2])):
+        previous = blocks[-1] if blocks else None
+        if (
+            previous is not None
+            and index is not None
+            and previous["source"] == source
+            and previous["last_index"] == index - 1
+        ):
+            previous["starts"].append(len(previous["text"]))
+            previous["text"] = stitch(previous["text"], text)
+            previous["chunk_ids"].append(chunk_id)
+            previous["last_index"] = index
+            previous["rank"] = min(previous["rank"], rank)
+            continue
+        blocks.append({"source": source, "chunk_ids": [chunk_id], "starts": [0], "text": text, "rank": rank, "last_index": index})
+    return sorted(blocks, key=lambda block: block["rank"])
+
+
+def assemble_context(docs: list, token_budget: int = CONTEXT_TOKEN_BUDGET, sanitize=None) -> str:
+    """
+    Formats ranked documents (best first) as citation-headed excerpts within `token_budget`:
+    overlapping neighbours are merged into one excerpt, excerpts whose text already appears are dropped,
+    and the lowest-ranked excerpt is cut at a sentence boundary (or left out) when the budget runs out.
+    """
+    sections, seen, used = [], [], 0
+    for block in merge_neighbours(docs):
+        normalized = _normalize(block["text"])
+        if any(normalized in earlier for earlier in seen):
+            continue
+        seen.append(normalized)
+
+        chunk_ids = block["chunk_ids"]
+        header = " ".join(f"[Source: {block['source']}, Chunk: {chunk_id}]" for chunk_id in chunk_ids)
+        text = sanitize(block["text"]) if sanitize else block["text"]
+        remaining = token_budget - used - estimate_tokens(header) - 1
+        if estimate_tokens(text) > remaining:
+            # The best excerpt is always included, trimmed if need be; later ones only if enough room is left
+            if sections and remaining < MIN_PARTIAL_TOKENS:
+                break
+            # sanitize only ever prepends a warning line, which shifts the chunk offsets
+            prefix = len(text) - len(block["text"])
+            text, kept = _truncate(text, max(remaining, MIN_PARTIAL_TOKENS))
+            # Cite only the chunks whose own text survived the cut
+            chunk_ids = [chunk_id for chunk_id, start in zip(chunk_ids, block["starts"]) if start + prefix < kept] or chunk_ids[:1]
+            header = " ".join(f"[Source: {block['source']}, Chunk: {chunk_id}]" for chunk_id in chunk_ids)
+
+        section = f"{header}\n{text}"
+        sections.append(section)
+        used += estimate_tokens(section)
+        if used >= token_budget:
+            break
+    return "\n\n".join(sections)
@@ -0,0 +1,291 @@
+# backend/core/conversations.py
+# Server-side chat sessions: bounded history with a rolling summary, plus per-session reuse of memory and retrieval.
+
+import asyncio
+import contextvars
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from fastapi.concurrency import run_in_threadpool
+
+from backend.core.cache import TTLLRUCache
+from backend.core.runtime import CHROMA_DB_DIR
+from backend.core.tracing import span
+
+CONVERSATION_DB_PATH = os.path.join(CHROMA_DB_DIR, "conversations.sqlite3")
+DEFAULT_USER_ID = "default"
+
+# Once a session holds more than CONVERSATION_MAX_MESSAGES, everything but the newest
+# CONVERSATION_KEEP_MESSAGES is folded into the session summary
+CONVERSATION_MAX_MESSAGES = int(os.getenv("CONVERSATION_MAX_MESSAGES", "12"))
+CONVERSATION_KEEP_MESSAGES = int(os.getenv("CONVERSATION_KEEP_MESSAGES", "6"))
+SESSION_TTL_S = float(os.getenv("SESSION_TTL_S", "86400"))
+# Expired sessions are deleted from SQLite at startup and then at most this often, when a session is created
+SESSION_PRUNE_INTERVAL_S = float(os.getenv("SESSION_PRUNE_INTERVAL_S", "3600"))
+# Entries kept per session in each reuse namespace (retrieval results, memory snapshots)
+SESSION_CACHE_SIZE = 32
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a user and an assistant.
+Keep the user's goals, stated facts and preferences, decisions made, open questions, and the sources cited.
+Drop small talk. Write at most 150 words of plain prose.
+
+Current summary:
+{summary}
+
+New turns to fold in:
+{turns}
+
+Updated summary:"""
+
+
+class ConversationStore:
+    """SQLite record of each session's owner, rolling summary and recent messages, shared by all API workers."""
+
+    def __init__(self, path: str = CONVERSATION_DB_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                summary TEXT NOT NULL DEFAULT '',
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                PRIMARY KEY (session_id, seq)
+            );
+            """
+        )
+        self._conn.commit()
+        self._last_prune = 0.0
+
+    def create(self, user_id: str) -> str:
+        session_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO sessions (session_id, user_id, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (session_id, user_id, now, now),
+            )
+        if now - self._last_prune > SESSION_PRUNE_INTERVAL_S:
+            self.prune()
+        return session_id
+
+    def get(self, session_id: str):
+        """{"session_id", "user_id", "summary", "messages": [(seq, role, content)]} or None if unknown/expired."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT user_id, summary, updated_at FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None or time.time() - row[2] > SESSION_TTL_S:
+                return None
+            messages = self._conn.execute(
+                "SELECT seq, role, content FROM messages WHERE session_id = ? ORDER BY seq", (session_id,)
+            ).fetchall()
+        return {"session_id": session_id, "user_id": row[0], "summary": row[1], "messages": messages}
+
+    def append(self, session_id: str, messages: list) -> None:
+        """Appends (role, content) messages after the session's last stored one."""
+        with self._lock, self._conn:
+            last = self._conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM messages WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+            self._conn.executemany(
+                "INSERT INTO messages (session_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                [(session_id, last + i + 1, role, content) for i, (role, content) in enumerate(messages)],
+            )
+            self._conn.execute("UPDATE sessions SET updated_at = ? WHERE session_id = ?", (time.time(), session_id))
+
+    def fold(self, session_id: str, summary: str, through_seq: int) -> None:
+        """Replaces the summary and drops the messages it now covers."""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE sessions SET summary = ? WHERE session_id = ?", (summary, session_id))
+            self._conn.execute("DELETE FROM messages WHERE session_id = ? AND seq <= ?", (session_id, through_seq))
+
+    def delete(self, session_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def prune(self) -> int:
+        """Deletes sessions idle for longer than SESSION_TTL_S."""
+        self._last_prune = time.time()
+        cutoff = self._last_prune - SESSION_TTL_S
+        with self._lock, self._conn:
+            expired = [row[0] for row in self._conn.execute("SELECT session_id FROM sessions WHERE updated_at < ?", (cutoff,))]
+            self._conn.executemany("DELETE FROM messages WHERE session_id = ?", [(s,) for s in expired])
+            self._conn.executemany("DELETE FROM sessions WHERE session_id = ?", [(s,) for s in expired])
+        return len(expired)
+
+
+class Session:
+    """
+    In-process state for one conversation: a lock that serialises its turns, the pending summary job,
+    and small caches of tool results that later turns reuse instead of recomputing.
+    """
+
+    def __init__(self, session_id: str, user_id: str):
+        self.session_id = session_id
+        self.user_id = user_id
+        self.lock = asyncio.Lock()
+        self.compaction = None
+        self._caches = {}
+        self._pending = {}
+        self._cache_lock = threading.Lock()
+
+    def cached(self, namespace: str, key, compute):
+        """
+        Returns the value stored under (namespace, key), computing and remembering it on a miss.
+        A caller that finds the same key already being computed (e.g. by a prefetch) waits for that result.
+        """
+        with self._cache_lock:
+            cache = self._caches.setdefault(namespace, OrderedDict())
+            if key in cache:
+                cache.move_to_end(key)
+                return cache[key]
+            pending = self._pending.get((namespace, key))
+            owner = pending is None
+            if owner:
+                pending = self._pending[(namespace, key)] = Future()
+        if not owner:
+            try:
+                return pending.result()
+            except Exception:
+                return compute()
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._cache_lock:
+                self._pending.pop((namespace, key), None)
+            pending.set_exception(e)
+            raise
+        with self._cache_lock:
+            cache[key] = value
+            while len(cache) > SESSION_CACHE_SIZE:
+                cache.popitem(last=False)
+            self._pending.pop((namespace, key), None)
+        pending.set_result(value)
+        return value
+
+    def latest(self, namespace: str):
+        """Most recently stored value in a namespace, or None."""
+        with self._cache_lock:
+            cache = self._caches.get(namespace)
+            return next(reversed(cache.values())) if cache else None
+
+
+_store = None
+_store_lock = threading.Lock()
+_sessions = TTLLRUCache(maxsize=int(os.getenv("SESSION_CACHE_MAX", "1024")), ttl=SESSION_TTL_S)
+# Sessions still referenced by a turn in progress or a pending compaction, even if _sessions evicted them,
+# so a returning session_id gets the same lock and compaction task instead of a fresh Session
+_live_sessions = weakref.WeakValueDictionary()
+_current_session = contextvars.ContextVar("current_session", default=None)
+
+
+def get_conversation_store() -> ConversationStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ConversationStore()
+        return _store
+
+
+def get_session(session_id: str, user_id: str) -> Session:
+    session = _sessions.get(session_id) or _live_sessions.get(session_id)
+    if session is None or session.user_id != user_id:
+        session = Session(session_id, user_id)
+        _live_sessions[session_id] = session
+    _sessions.set(session_id, session)
+    return session
+
+
+def drop_session(session_id: str) -> None:
+    _sessions.pop(session_id)
+    _live_sessions.pop(session_id, None)
+
+
+def activate_session(session: Session) -> None:
+    """Makes `session` visible to tools running for the current request (threads inherit the context)."""
+    _current_session.set(session)
+
+
+def current_session():
+    return _current_session.get()
+
+
+def current_user_id() -> str:
+    session = _current_session.get()
+    return session.user_id if session is not None else DEFAULT_USER_ID
+
+
+def build_messages(conversation: dict, message: str, memory_snapshot: str = None) -> list:
+    """Agent input for one turn: summary and memory context, then the recent history, then the new message."""
+    context = []
+    if conversation["summary"]:
+        context.append(f"CONVERSATION SUMMARY (earlier turns in this session):\n{conversation['summary']}")
+    if memory_snapshot:
+        context.append(
+            "MEMORY SNAPSHOT (every stored fact, read at the start of this turn):\n"
+            + memory_snapshot
+        )
+    messages = [("system", "\n\n".join(context))] if context else []
+    messages += [(role, content) for _, role, content in conversation["messages"]]
+    messages.append(("user", message))
+    return messages
+
+
+async def summarize(llm, summary: str, messages: list) -> str:
+    """Folds (role, content) messages into the running summary with one LLM call."""
+    turns = "\n".join(f"{role.upper()}: {content}" for role, content in messages)
+    with span("conversation.summarize", messages=len(messages)):
+        response = await llm.ainvoke(SUMMARY_PROMPT.format(summary=summary or "(none)", turns=turns))
+    content = response.content
+    if isinstance(content, list):
+        content = "".join(block.get("text", "") for block in content if isinstance(block, dict))
+    return content.strip()
+
+
+async def compact(session: Session, llm) -> None:
+    """Summarizes the oldest messages once the session exceeds CONVERSATION_MAX_MESSAGES."""
+    store = get_conversation_store()
+    conversation = await run_in_threadpool(store.get, session.session_id)
+    if conversation is None or len(conversation["messages"]) <= CONVERSATION_MAX_MESSAGES:
+        return
+    old = conversation["messages"][:-CONVERSATION_KEEP_MESSAGES]
+    try:
+        summary = await summarize(llm, conversation["summary"], [(role, content) for _, role, content in old])
+    except Exception as e:
+        # Keep the messages: the next turn is over the limit too and retries the summary
+        print(f"[conversations] summary failed for {session.session_id}: {e}")
+        return
+    await run_in_threadpool(store.fold, session.session_id, summary, through_seq=old[-1][0])
+
+
+def schedule_compaction(session: Session, llm) -> None:
+    """Runs compact() after the reply has been sent; the session's next turn waits for it."""
+    session.compaction = asyncio.create_task(compact(session, llm))
+
+
+async def wait_for_compaction(session: Session) -> None:
+    task, session.compaction = session.compaction, None
+    if task is not None:
+        try:
+            await task
+        except Exception:
+            pass
@@ -1,24 +1,52 @@
 import os
+import re
+from datetime import datetime
+from typing import List, Optional
 from dotenv import load_dotenv
 from langchain_core.tools import tool
 from langchain.agents import create_agent
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_groq import ChatGroq
 
-from backend.tools.rag_tool import retrieve_context
-from backend.tools.memory_tool import save_memory, get_memory
+from backend.tools.rag_tool import retrieve_context, normalize_query
+from backend.core.conversations import current_session
+from backend.core.runtime import get_index_version
+from backend.core.vector_index import build_where
+from backend.ingest.manifest import get_manifest
+from backend.tools.memory_tool import save_memory, get_memory, memory_snapshot
 from backend.tools.sandbox_tool import execute_python
 from backend.core.prompts import SYSTEM_PROMPT
+from backend.core.agent_middleware import PrefetchMiddleware, ToolTimeoutMiddleware
 
 load_dotenv()
 
 @tool
-def search_documents(query: str) -> str:
+def search_documents(
+    query: str,
+    source: Optional[str] = None,
+    tags: Optional[List[str]] = None,
+    uploaded_after: Optional[str] = None,
+    k: int = 4,
+) -> str:
     """
     Search the uploaded documents for context. 
+    Optionally scope the search: `source` is an exact filename, `tags` are upload tags that must all match,
+    `uploaded_after` is an ISO date (YYYY-MM-DD), and `k` (1-10) is the number of chunks to return.
     Returns the technical context or a 'NOT_FOUND' signal.
     """
-    context = retrieve_context(query)
+    try:
+        after = datetime.fromisoformat(uploaded_after).timestamp() if uploaded_after else None
+    except ValueError:
+        return f"SEARCH_ERROR: uploaded_after must be an ISO date (YYYY-MM-DD), got '{uploaded_after}'."
+    where = build_where(source=source, tags=[tag.lower() for tag in tags or []], uploaded_after=after)
+    k = max(1, min(k, 10))
+    session = current_session()
+    if session is not None:
+        # Follow-up turns often repeat a search; reuse it for the whole session while the index is unchanged
+        key = (normalize_query(query), k, repr(where), get_index_version())
+        context = session.cached("retrieval", key, lambda: retrieve_context(query, k=k, where=where))
+    else:
+        context = retrieve_context(query, k=k, where=where)
     # The Grounding Guard
     if not context or "No relevant information found" in context:
         return "GROUNDING_SIGNAL: NOT_FOUND. The requested information is missing from all uploaded documents."
@@ -27,9 +55,48 @@ def search_documents(query: str) -> str:
 # 2. Add save_memory to the agent's toolkit
 tools = [search_documents, save_memory, get_memory, execute_python]
 
+# Questions about the uploaded material rather than chit-chat, memory updates or analytics
+_DOCUMENT_CUES = re.compile(
+    r"\b(document|doc|file|report|pdf|upload(ed)?|policy|contract|manual|section|page|according to|cite|source)s?\b",
+    re.IGNORECASE,
+)
+
+def _looks_document_bound(message: str) -> bool:
+    if _DOCUMENT_CUES.search(message):
+        return True
+    lowered = message.lower()
+    # Names an indexed file, with or without its extension
+    stems = {os.path.splitext(os.path.basename(name))[0].lower() for name in get_manifest().files()}
+    return any(len(stem) >= 4 and stem in lowered for stem in stems)
+
+def _prefetch_memory(message: str, first_turn: bool):
+    session = current_session()
+    # With a valid MEMORY SNAPSHOT in the prompt the model won't call get_memory
+    if session is None or memory_snapshot(session) is not None:
+        return None
+    # Same arguments as the BOOTSTRAP rule, so the model's own call finds this in the session cache
+    get_memory.func(query=message)
+    return ""
+
+def _prefetch_search(message: str, first_turn: bool):
+    # Follow-ups ("and for Q3?") rarely make a useful query on their own; the model rewrites those
+    if current_session() is None or not (first_turn or _looks_document_bound(message)):
+        return None
+    context = search_documents.func(query=message)
+    return (
+        "PREFETCHED DOCUMENT SEARCH (search_documents with the user's message as the query). Answer from it if it "
+        "covers the question, citing as usual; otherwise call `search_documents` with a better query.\n" + context
+    )
+
+# Memory is warmed for the tool call the prompt requires; the search result is offered to the model as context
+prefetchers = {"get_memory": _prefetch_memory, "search_documents": _prefetch_search}
+
+# Shared with scripts/bench.py, so the benchmarked agent runs the same prefetch and timeout layers
+AGENT_MIDDLEWARE = [PrefetchMiddleware(prefetchers), ToolTimeoutMiddleware()]
+
 
 # ** If you want to use Gemini
 # llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash-lite", temperature=0) 
 llm = ChatGroq(model="qwen/qwen3-32b", temperature=0)
 
-agent_executor = create_agent(llm, tools=tools, system_prompt=SYSTEM_PROMPT)
\ No newline at end of file
+agent_executor = create_agent(llm, tools=tools, system_prompt=SYSTEM_PROMPT, middleware=AGENT_MIDDLEWARE)
@@ -0,0 +1,201 @@
+# backend/core/lexical_index.py
+# BM25 keyword index over the same chunks as the Chroma collection (SQLite FTS5).
+
+import os
+import re
+import sqlite3
+import threading
+
+from backend.core.cache import TTLLRUCache
+from backend.core.runtime import CHROMA_DB_DIR
+
+LEXICAL_INDEX_PATH = os.path.join(CHROMA_DB_DIR, "lexical_index.sqlite3")
+
+# Keeps numbers like "14.5%" and IDs like "SEC-104" together as a single query phrase
+_TERM_PATTERN = re.compile(r"[\w][\w.%\-/]*")
+
+# Very common words match most chunks; dropping them keeps lookups cheap on large corpora
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "does", "for", "from", "how", "in", "is", "it",
+    "of", "on", "or", "the", "this", "to", "was", "what", "when", "where", "which", "who", "why", "with",
+}
+# Past this many chunks, terms found in more than half of them are dropped from queries too: FTS5 floors
+# their BM25 IDF at ~0 anyway, and scoring their postings is what makes lookups slow on large corpora
+LEXICAL_DF_MIN_CHUNKS = int(os.getenv("LEXICAL_DF_MIN_CHUNKS", "1000"))
+# Document frequencies cost a postings scan for common terms, so they are cached for this long
+LEXICAL_DF_TTL_S = float(os.getenv("LEXICAL_DF_TTL_S", "3600"))
+# Most matches BM25-scored per query. The OR-query keeps the rarest terms whose postings fit; a query whose
+# every term is more frequent than this ranks a sample of this many matches instead of all of them
+LEXICAL_MAX_CANDIDATES = int(os.getenv("LEXICAL_MAX_CANDIDATES", "2000"))
+
+
+def query_terms(query: str) -> list:
+    """Lower-cased terms of a free-text query, without stop-words or repeats."""
+    terms = []
+    for term in _TERM_PATTERN.findall(query.lower()):
+        term = term.strip(".-/")
+        if (len(term) > 1 or term.isdigit()) and term not in STOPWORDS and term not in terms:
+            terms.append(term)
+    return terms
+
+
+def build_match_query(terms: list, operator: str = "OR") -> str:
+    """Joins terms into an FTS5 query with `operator`. FTS5 tokenizes each quoted term as an exact phrase."""
+    return f" {operator} ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+class LexicalIndex:
+    """
+    Inverted index with BM25 ranking, keyed by chunk_id so it mirrors Chroma upserts and deletes.
+    FTS5 keeps postings on disk and only scores documents that contain a query term.
+    """
+
+    def __init__(self, path: str = LEXICAL_INDEX_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS docs (
+                rowid INTEGER PRIMARY KEY,
+                chunk_id TEXT UNIQUE NOT NULL,
+                source TEXT,
+                content TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS docs_source ON docs(source);
+            CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(
+                content, content='docs', content_rowid='rowid'
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS docs_vocab USING fts5vocab(docs_fts, 'row');
+            CREATE TRIGGER IF NOT EXISTS docs_ai AFTER INSERT ON docs BEGIN
+                INSERT INTO docs_fts(rowid, content) VALUES (new.rowid, new.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS docs_ad AFTER DELETE ON docs BEGIN
+                INSERT INTO docs_fts(docs_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+            END;
+            """
+        )
+        self._conn.commit()
+        self._doc_freq = TTLLRUCache(maxsize=10000, ttl=LEXICAL_DF_TTL_S)
+
+    def upsert(self, entries: list) -> None:
+        """Adds or replaces (chunk_id, source, text) entries."""
+        if not entries:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM docs WHERE chunk_id = ?", [(chunk_id,) for chunk_id, _, _ in entries])
+            self._conn.executemany("INSERT INTO docs (chunk_id, source, content) VALUES (?, ?, ?)", entries)
+        self._doc_freq.pop("")
+
+    def delete(self, chunk_ids: list) -> None:
+        if not chunk_ids:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM docs WHERE chunk_id = ?", [(chunk_id,) for chunk_id in chunk_ids])
+        self._doc_freq.pop("")
+
+    def search(self, query: str, k: int = 10, source: str = None) -> list:
+        """
+        Returns up to k (chunk_id, source, text, score) tuples, best BM25 match first, optionally within one source.
+        Chunks holding every query term come first; the OR-query only runs when they are fewer than k.
+        """
+        terms = self._selective_terms(query_terms(query))
+        if not terms:
+            return []
+        span = None
+        if source:
+            # A file's chunks are written together, so their rowids form a narrow range FTS5 can seek to
+            with self._lock:
+                span = self._conn.execute("SELECT MIN(rowid), MAX(rowid) FROM docs WHERE source = ?", (source,)).fetchone()
+            if span[0] is None:
+                return []
+        results = self._search(build_match_query([term for term, _ in terms], "AND"), k, source, span)
+        if len(results) < k and len(terms) > 1:
+            rarest, postings = [], 0
+            for term, freq in sorted(terms, key=lambda item: item[1]):
+                if rarest and postings + freq > LEXICAL_MAX_CANDIDATES:
+                    break
+                rarest.append(term)
+                postings += freq
+            seen = {row[0] for row in results}
+            more = self._search(build_match_query(rarest), k, source, span)
+            results += [row for row in more if row[0] not in seen][:k - len(results)]
+        return results
+
+    def _selective_terms(self, terms: list) -> list:
+        """(term, document frequency) pairs, without the terms too common to help ranking."""
+        # "" is never a query term, so it holds the chunk count next to the per-term frequencies
+        total = self._doc_freq.get("")
+        if total is None:
+            total = self.count()
+            self._doc_freq.set("", total)
+        selective = []
+        for term in terms:
+            freq = self._doc_freq.get(term)
+            if freq is None:
+                with self._lock:
+                    row = self._conn.execute("SELECT doc FROM docs_vocab WHERE term = ?", (term,)).fetchone()
+                freq = row[0] if row else 0
+                self._doc_freq.set(term, freq)
+            if total < LEXICAL_DF_MIN_CHUNKS or freq <= total / 2:
+                selective.append((term, freq))
+        return selective
+
+    def _search(self, match: str, k: int, source: str = None, span: tuple = None) -> list:
+        # At most LEXICAL_MAX_CANDIDATES matches are scored, and only the k winners are joined back to their text
+        span_clause = "AND rowid BETWEEN ? AND ?" if span else ""
+        source_clause = "WHERE rowid IN (SELECT rowid FROM docs WHERE source = ?)" if source else ""
+        params = (match, *(span or ()), LEXICAL_MAX_CANDIDATES, *((source,) if source else ()), k)
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                SELECT docs.chunk_id, docs.source, docs.content, ranked.rank FROM (
+                    SELECT rowid, rank FROM (
+                        SELECT rowid, rank FROM docs_fts WHERE docs_fts MATCH ? {span_clause} LIMIT ?
+                    ) {source_clause} ORDER BY rank LIMIT ?
+                ) AS ranked JOIN docs ON docs.rowid = ranked.rowid
+                ORDER BY ranked.rank
+                """,
+                params,
+            ).fetchall()
+        # FTS5's rank is bm25(), which is negative (lower is better); flip it so higher means more relevant
+        return [(chunk_id, source, content, -score) for chunk_id, source, content, score in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM docs")
+        self._doc_freq.clear()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_lexical_index() -> LexicalIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = LexicalIndex()
+        return _index
+
+
+def sync_with_vector_index(vector_index, page_size: int = 5000) -> int:
+    """Rebuilds the keyword index from the vector index when their sizes disagree (e.g. data indexed before it existed)."""
+    index = get_lexical_index()
+    total = vector_index.count()
+    if index.count() == total:
+        return 0
+    index.clear()
+    for offset in range(0, total, page_size):
+        page = vector_index.page(offset, page_size)
+        index.upsert([
+            (chunk_id, (metadata or {}).get("source"), text)
+            for chunk_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"])
+        ])
+    return total
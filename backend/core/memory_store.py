@@ -0,0 +1,175 @@
+# backend/core/memory_store.py
+# Cached, lock-protected view of the Markdown memory files with dedup and relevance-ranked lookup.
+
+import os
+import re
+import threading
+import numpy as np
+
+from backend.core.runtime import get_embedding_model
+from backend.core.tracing import span
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to the in-process lock only
+    fcntl = None
+
+# get_memory returns at most this many entries per file when given a query
+MEMORY_TOP_N = int(os.getenv("MEMORY_TOP_N", "8"))
+
+_ENTRY_PATTERN = re.compile(r"^\s*[-*]\s+(.*\S)\s*$")
+
+
+def normalize_fact(text: str) -> str:
+    """Case, punctuation and whitespace-insensitive form used to detect repeated facts."""
+    return " ".join(re.sub(r"[^\w%.]+", " ", text.lower()).split()).strip(" .")
+
+
+def parse_entries(markdown: str) -> list:
+    """Bullet entries of a memory file, skipping the header and anything inside HTML comments."""
+    entries, in_comment = [], False
+    for line in markdown.splitlines():
+        if in_comment:
+            in_comment = "-->" not in line
+            continue
+        if line.lstrip().startswith("<!--"):
+            in_comment = "-->" not in line
+            continue
+        match = _ENTRY_PATTERN.match(line)
+        if match:
+            entries.append(match.group(1))
+    return entries
+
+
+class MemoryStore:
+    """
+    One Markdown memory file (USER_MEMORY.md / COMPANY_MEMORY.md). Entries are parsed once and re-read only
+    when the file's mtime or size changes, so edits by hand or by another worker are picked up on the next call.
+    Appends hold a process lock plus an flock on the file, and skip facts that are already stored.
+    """
+
+    def __init__(self, path: str, label: str):
+        self.path = path
+        self.label = label
+        self._lock = threading.RLock()
+        self._signature = None
+        self._entries = []
+        self._normalized = set()
+        # Embeddings are keyed by entry text so a reload only embeds the new entries
+        self._vectors = {}
+
+    # --- cache ---
+    def _stat_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _load(self):
+        signature = self._stat_signature()
+        if signature == self._signature:
+            return
+        with span("memory.read", target=self.label):
+            if signature is None:
+                content = ""
+            else:
+                with open(self.path, "r") as f:
+                    content = f.read()
+        self._entries = parse_entries(content)
+        self._normalized = {normalize_fact(entry) for entry in self._entries}
+        current = set(self._entries)
+        self._vectors = {entry: vector for entry, vector in self._vectors.items() if entry in current}
+        self._signature = signature
+
+    def signature(self):
+        """Changes whenever the file does; lets callers tell whether something they derived from it is stale."""
+        return self._stat_signature()
+
+    def entries(self) -> list:
+        with self._lock:
+            self._load()
+            return list(self._entries)
+
+    # --- writes ---
+    def _ensure_file(self):
+        if not os.path.exists(self.path):
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a") as f:
+                if f.tell() == 0:
+                    f.write(f"# {self.label} MEMORY\n\n")
+
+    def add(self, fact: str) -> bool:
+        """Appends `fact` as a bullet unless an equivalent one is stored. Returns False for duplicates."""
+        fact = " ".join(fact.split())
+        normalized = normalize_fact(fact)
+        with self._lock:
+            self._load()
+            if normalized in self._normalized:
+                return False
+            self._ensure_file()
+            with span("memory.write", target=self.label), open(self.path, "a+") as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    # Re-read under the file lock: another worker may have written since our cache was filled
+                    f.seek(0)
+                    content = f.read()
+                    if normalized in {normalize_fact(entry) for entry in parse_entries(content)}:
+                        return False
+                    # Leading newline keeps the entry clear of a trailing comment block
+                    f.write(f"\n- {fact}\n")
+                    f.flush()
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+            self._signature = None
+            return True
+
+    # --- lookup ---
+    def _embed_entries(self, entries: list) -> np.ndarray:
+        missing = [entry for entry in entries if entry not in self._vectors]
+        if missing:
+            with span("memory.embed", target=self.label, count=len(missing)):
+                for entry, vector in zip(missing, get_embedding_model().embed_documents(missing)):
+                    self._vectors[entry] = np.asarray(vector, dtype=np.float32)
+        return np.stack([self._vectors[entry] for entry in entries])
+
+    def relevant(self, query: str = None, top_n: int = MEMORY_TOP_N) -> list:
+        """
+        Entries most similar to `query`, best first. Without a query, or when the file holds no more than
+        `top_n` entries, every entry is returned in file order and nothing is embedded.
+        """
+        with self._lock:
+            self._load()
+            entries = list(self._entries)
+            if not query or len(entries) <= top_n:
+                return entries
+            vectors = self._embed_entries(entries)
+        query_vector = np.asarray(get_embedding_model().embed_query(query), dtype=np.float32)
+        scores = vectors @ query_vector / np.maximum(np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_vector), 1e-12)
+        return [entries[i] for i in np.argsort(-scores)[:top_n]]
+
+    def render(self, query: str = None, top_n: int = MEMORY_TOP_N) -> str:
+        """Markdown block in the `--- LABEL MEMORY ---` layout the agent has always been given."""
+        entries = self.relevant(query, top_n)
+        if not entries:
+            return f"--- {self.label} MEMORY ---\n(Empty: No facts stored yet)"
+        total = len(self.entries())
+        header = f"--- {self.label} MEMORY ---"
+        if len(entries) < total:
+            header += f" (top {len(entries)} of {total} by relevance)"
+        return header + "\n" + "\n".join(f"- {entry}" for entry in entries)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_memory_store(path: str, label: str) -> MemoryStore:
+    """Process-wide store per memory file, so every request shares one parsed cache."""
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = MemoryStore(path, label)
+        return store
@@ -0,0 +1,101 @@
+# backend/core/reranker.py
+# Second retrieval stage: a small CPU cross-encoder rescoring a wider candidate set, with cached scores and adaptive k.
+
+import hashlib
+import math
+import os
+import threading
+import time
+
+from backend.core.cache import TTLLRUCache
+from backend.core.tracing import span
+
+# Off by default: the cross-encoder costs ~10-40 ms per batch of candidates on CPU
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "0") == "1"
+RERANK_MODEL_NAME = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# First-stage candidates fetched per query when reranking
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+
+# Adaptive k: once the best chunk is at least RERANK_CONFIDENT, keep only chunks scoring at least
+# RERANK_RELATIVE_CUTOFF x the best one (never fewer than RERANK_MIN_K). Below it, return the full k.
+RERANK_CONFIDENT = float(os.getenv("RERANK_CONFIDENT", "0.5"))
+RERANK_RELATIVE_CUTOFF = float(os.getenv("RERANK_RELATIVE_CUTOFF", "0.3"))
+RERANK_MIN_K = int(os.getenv("RERANK_MIN_K", "1"))
+
+_lock = threading.Lock()
+_model = None
+_load_s = None
+
+# Scores depend only on the query and the chunk text, so they survive re-ingestion of unchanged chunks
+_score_cache = TTLLRUCache(
+    maxsize=int(os.getenv("RERANK_CACHE_SIZE", "20000")),
+    ttl=float(os.getenv("RERANK_CACHE_TTL", "3600")),
+)
+
+
+def get_cross_encoder():
+    """Returns the shared cross-encoder, loading it on first use."""
+    global _model, _load_s
+    with _lock:
+        if _model is None:
+            from sentence_transformers import CrossEncoder
+
+            start = time.perf_counter()
+            _model = CrossEncoder(RERANK_MODEL_NAME, max_length=256, device="cpu")
+            _load_s = round(time.perf_counter() - start, 4)
+        return _model
+
+
+def _text_key(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _probability(logit: float) -> float:
+    return 1.0 / (1.0 + math.exp(-logit))
+
+
+def rerank(query: str, docs: list) -> list:
+    """(Document, relevance in 0..1) pairs, best first. Only (query, chunk) pairs not already cached are scored."""
+    if not docs:
+        return []
+    keys = [(query, _text_key(doc.page_content)) for doc in docs]
+    scores = [_score_cache.get(key) for key in keys]
+    missing = [i for i, score in enumerate(scores) if score is None]
+    if missing:
+        with span("retrieval.rerank", scored=len(missing), cached=len(docs) - len(missing)):
+            logits = get_cross_encoder().predict(
+                [(query, docs[i].page_content) for i in missing],
+                batch_size=RERANK_BATCH_SIZE,
+                show_progress_bar=False,
+            )
+        for i, logit in zip(missing, logits):
+            scores[i] = _probability(float(logit))
+            _score_cache.set(keys[i], scores[i])
+    return sorted(zip(docs, scores), key=lambda pair: pair[1], reverse=True)
+
+
+def adaptive_k(scored: list, k: int) -> list:
+    """Cuts reranked (doc, score) pairs to between RERANK_MIN_K and k documents."""
+    if not scored:
+        return []
+    best = scored[0][1]
+    if best < RERANK_CONFIDENT:
+        # No confident match: give the model the full k rather than a thin, possibly wrong context
+        return [doc for doc, _ in scored[:k]]
+    kept = [doc for doc, score in scored[:k] if score >= best * RERANK_RELATIVE_CUTOFF]
+    return kept if len(kept) >= RERANK_MIN_K else [doc for doc, _ in scored[:RERANK_MIN_K]]
+
+
+def reranker_stats() -> dict:
+    return {
+        "enabled": RERANK_ENABLED,
+        "model": RERANK_MODEL_NAME,
+        "model_load_s": _load_s,
+        "candidates": RERANK_CANDIDATES,
+        "scores": _score_cache.stats(),
+    }
+
+
+def clear_rerank_cache() -> None:
+    _score_cache.clear()
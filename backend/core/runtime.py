@@ -0,0 +1,166 @@
+# backend/core/runtime.py
+# Process-wide embedding model and vector store, shared by ingestion and retrieval.
+
+import os
+import tempfile
+import threading
+import time
+from langchain_community.vectorstores import Chroma
+from langchain_community.embeddings.sentence_transformer import SentenceTransformerEmbeddings
+
+CHROMA_DB_DIR = os.getenv("CHROMA_DB_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), ".chroma_data"))
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+# Index version shared by every API worker and the offline indexer, so a bump in one invalidates retrieval caches in all
+INDEX_VERSION_PATH = os.path.join(CHROMA_DB_DIR, "index_version")
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to the in-process lock only
+    fcntl = None
+
+# HNSW graph parameters, applied when the Chroma collection is first created
+HNSW_SETTINGS = {
+    "hnsw:space": os.getenv("HNSW_SPACE", "l2"),
+    "hnsw:M": int(os.getenv("HNSW_M", "16")),
+    "hnsw:construction_ef": int(os.getenv("HNSW_CONSTRUCTION_EF", "100")),
+    "hnsw:search_ef": int(os.getenv("HNSW_SEARCH_EF", "64")),
+}
+
+# Guarded by _lock so concurrent requests never load the model twice
+_lock = threading.RLock()
+_embedding_model = None
+_vectorstore = None
+
+# Load/open timings, reported through the readiness endpoint
+_timings = {
+    "embedding_model_load_s": None,
+    "vectorstore_open_s": None,
+    "warmup_s": None,
+    "embedding_model_calls": 0,
+    "vectorstore_calls": 0,
+}
+
+# Bumped whenever ingestion changes the collection; retrieval caches key on it
+_index_version = 0
+# (mtime, size, inode) of INDEX_VERSION_PATH when _index_version was last read from it
+_index_version_stat = None
+_version_lock = threading.Lock()
+
+# Per-operation latency, split into the first (cold) call and later (warm) calls
+_call_stats = {}
+
+
+def get_embedding_model():
+    """Returns the shared SentenceTransformer embedding model, loading it on first use."""
+    global _embedding_model
+    with _lock:
+        _timings["embedding_model_calls"] += 1
+        if _embedding_model is None:
+            start = time.perf_counter()
+            _embedding_model = SentenceTransformerEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+            _timings["embedding_model_load_s"] = round(time.perf_counter() - start, 4)
+        return _embedding_model
+
+
+def get_vectorstore():
+    """Returns the shared Chroma store bound to CHROMA_DB_DIR, opening it on first use."""
+    global _vectorstore
+    with _lock:
+        _timings["vectorstore_calls"] += 1
+        if _vectorstore is None:
+            embedding_function = get_embedding_model()
+            start = time.perf_counter()
+            _vectorstore = Chroma(
+                persist_directory=CHROMA_DB_DIR,
+                embedding_function=embedding_function,
+                collection_metadata=HNSW_SETTINGS,
+            )
+            _timings["vectorstore_open_s"] = round(time.perf_counter() - start, 4)
+        return _vectorstore
+
+
+def warm_up() -> dict:
+    """Loads the model and opens the store ahead of the first request, then embeds a probe query."""
+    start = time.perf_counter()
+    embedding_function = get_embedding_model()
+    get_vectorstore()
+    # The first encode pays for tokenizer/graph initialisation; do it here, not on a user request
+    embedding_function.embed_query("warm up")
+    _timings["warmup_s"] = round(time.perf_counter() - start, 4)
+    return runtime_status()
+
+
+def _read_index_version() -> int:
+    """Current shared version; costs one stat unless another process has bumped it. Call with _version_lock held."""
+    global _index_version, _index_version_stat
+    try:
+        stat = os.stat(INDEX_VERSION_PATH)
+    except OSError:
+        return _index_version
+    signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    if signature != _index_version_stat:
+        try:
+            with open(INDEX_VERSION_PATH) as f:
+                _index_version = int(f.read().strip() or 0)
+            _index_version_stat = signature
+        except (OSError, ValueError):
+            pass
+    return _index_version
+
+
+def get_index_version() -> int:
+    with _version_lock:
+        return _read_index_version()
+
+
+def bump_index_version() -> int:
+    """Marks the collection as changed, in every process, so cached retrieval results are no longer served."""
+    global _index_version
+    os.makedirs(CHROMA_DB_DIR, exist_ok=True)
+    with _version_lock, open(INDEX_VERSION_PATH + ".lock", "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        version = _read_index_version() + 1
+        # Atomic replace: readers in other workers never see a half-written number
+        fd, tmp_path = tempfile.mkstemp(dir=CHROMA_DB_DIR, prefix=".index_version")
+        with os.fdopen(fd, "w") as f:
+            f.write(str(version))
+        os.replace(tmp_path, INDEX_VERSION_PATH)
+        _index_version = version
+        return version
+
+
+def record_call(operation: str, seconds: float) -> None:
+    """Records the latency of a retrieval/ingestion call so cold vs warm cost is visible."""
+    with _lock:
+        stats = _call_stats.setdefault(operation, {"first_call_s": None, "calls": 0, "later_calls_total_s": 0.0})
+        if stats["first_call_s"] is None:
+            stats["first_call_s"] = round(seconds, 4)
+        else:
+            stats["later_calls_total_s"] += seconds
+        stats["calls"] += 1
+
+
+def is_ready() -> bool:
+    return _embedding_model is not None and _vectorstore is not None
+
+
+def runtime_status() -> dict:
+    """Snapshot of readiness and the time spent loading shared resources."""
+    calls = {}
+    with _lock:
+        for operation, stats in _call_stats.items():
+            later = stats["calls"] - 1
+            calls[operation] = {
+                "calls": stats["calls"],
+                "first_call_s": stats["first_call_s"],
+                "later_calls_avg_s": round(stats["later_calls_total_s"] / later, 4) if later > 0 else None,
+            }
+    return {
+        "ready": is_ready(),
+        "embedding_model": EMBEDDING_MODEL_NAME,
+        "persist_directory": CHROMA_DB_DIR,
+        "index_version": get_index_version(),
+        **_timings,
+        "calls": calls,
+    }
@@ -0,0 +1,150 @@
+# backend/core/sandbox_http.py
+# HTTP client handed to sandboxed code: one pooled session per worker, an on-disk response cache and fixture replay.
+# Loaded by sandbox_worker.py inside the worker process, so it only depends on the standard library and requests.
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+from urllib.parse import parse_qsl, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+# live: fetch and cache; record: live, and also save every response as a fixture; replay: fixtures only, no network
+SANDBOX_HTTP_MODE = os.getenv("SANDBOX_HTTP_MODE", "live")
+HTTP_CACHE_DIR = os.getenv("SANDBOX_HTTP_CACHE_DIR", os.path.join(tempfile.gettempdir(), "sandbox_http_cache"))
+HTTP_FIXTURES_DIR = os.getenv(
+    "SANDBOX_HTTP_FIXTURES_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "fixtures", "http"),
+)
+HTTP_TIMEOUT_S = float(os.getenv("SANDBOX_HTTP_TIMEOUT_S", "15"))
+
+# Archive days are final once the reanalysis catches up (about five days behind); forecasts change hourly
+ARCHIVE_TTL_S = float(os.getenv("HTTP_CACHE_ARCHIVE_TTL_S", str(30 * 86400)))
+RECENT_ARCHIVE_TTL_S = float(os.getenv("HTTP_CACHE_RECENT_ARCHIVE_TTL_S", "3600"))
+FORECAST_TTL_S = float(os.getenv("HTTP_CACHE_FORECAST_TTL_S", "900"))
+ARCHIVE_SETTLE_DAYS = 5
+
+
+def canonical_request(url: str, params=None) -> tuple:
+    """(url without query, sorted params) so `?a=1&b=2` in the URL and `params={...}` share one cache entry."""
+    parts = urlsplit(url)
+    merged = parse_qsl(parts.query, keep_blank_values=True)
+    if isinstance(params, dict):
+        for key, value in params.items():
+            values = value if isinstance(value, (list, tuple)) else [value]
+            # requests drops None-valued params, so they must not change the key either
+            merged += [(key, str(item)) for item in values if item is not None]
+    elif params:
+        merged += [(key, str(value)) for key, value in params]
+    base = urlunsplit((parts.scheme, parts.netloc.lower(), parts.path, "", ""))
+    return base, sorted(merged)
+
+
+def cache_key(base: str, params: list) -> str:
+    return hashlib.sha256(json.dumps([base, params]).encode("utf-8")).hexdigest()
+
+
+def cache_ttl(base: str, params: list) -> float:
+    """Seconds a response may be served from cache; 0 means the URL is not cached."""
+    host = urlsplit(base).netloc
+    if host.startswith("archive-api.open-meteo.com"):
+        end_date = dict(params).get("end_date")
+        try:
+            recent = date.fromisoformat(end_date) >= date.today() - timedelta(days=ARCHIVE_SETTLE_DAYS)
+        except (TypeError, ValueError):
+            recent = True
+        return RECENT_ARCHIVE_TTL_S if recent else ARCHIVE_TTL_S
+    if host.endswith("open-meteo.com"):
+        return FORECAST_TTL_S
+    return 0.0
+
+
+def _read_entry(path: str):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_entry(directory: str, key: str, entry: dict) -> None:
+    # Atomic replace: several workers may fetch the same URL at once
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(entry, f)
+    os.replace(tmp_path, os.path.join(directory, f"{key}.json"))
+
+
+def _to_response(entry: dict, source: str) -> requests.Response:
+    response = requests.Response()
+    response.status_code = entry["status"]
+    response._content = entry["body"].encode("utf-8")
+    response.encoding = "utf-8"
+    response.headers = CaseInsensitiveDict({**entry.get("headers", {}), "X-Sandbox-Cache": source})
+    response.url = entry["url"]
+    return response
+
+
+class CachedHTTPClient:
+    """
+    `get()` with the signature of requests.get. Successful responses from cacheable hosts are stored under
+    HTTP_CACHE_DIR for their TTL; in replay mode every response must come from HTTP_FIXTURES_DIR.
+    Anything else on the `requests` module is passed through untouched.
+    """
+
+    def __init__(self, mode: str = SANDBOX_HTTP_MODE, cache_dir: str = HTTP_CACHE_DIR, fixtures_dir: str = HTTP_FIXTURES_DIR):
+        self.mode = mode
+        self.cache_dir = cache_dir
+        self.fixtures_dir = fixtures_dir
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=2)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.stats = {"hits": 0, "misses": 0, "replayed": 0}
+
+    def __getattr__(self, name):
+        return getattr(requests, name)
+
+    def get(self, url, params=None, **kwargs) -> requests.Response:
+        base, canonical = canonical_request(url, params)
+        key = cache_key(base, canonical)
+
+        if self.mode == "replay":
+            entry = _read_entry(os.path.join(self.fixtures_dir, f"{key}.json"))
+            if entry is None:
+                raise requests.ConnectionError(
+                    f"Offline replay: no fixture for {base} {canonical}. Record one with SANDBOX_HTTP_MODE=record."
+                )
+            self.stats["replayed"] += 1
+            return _to_response(entry, "replay")
+
+        ttl = cache_ttl(base, canonical)
+        cache_path = os.path.join(self.cache_dir, f"{key}.json")
+        if ttl > 0:
+            entry = _read_entry(cache_path)
+            if entry is not None and time.time() - entry["fetched_at"] < ttl:
+                self.stats["hits"] += 1
+                return _to_response(entry, "hit")
+
+        self.stats["misses"] += 1
+        kwargs.setdefault("timeout", HTTP_TIMEOUT_S)
+        response = self.session.get(base, params=canonical, **kwargs)
+        entry = {
+            "url": response.url,
+            "status": response.status_code,
+            "headers": {"Content-Type": response.headers.get("Content-Type", "")},
+            "body": response.text,
+            "fetched_at": time.time(),
+        }
+        if response.status_code == 200 and ttl > 0:
+            _write_entry(self.cache_dir, key, entry)
+        if self.mode == "record" and response.status_code == 200:
+            _write_entry(self.fixtures_dir, key, entry)
+        response.headers["X-Sandbox-Cache"] = "miss"
+        return response
@@ -0,0 +1,250 @@
+# backend/core/sandbox_pool.py
+# Pool of pre-started sandbox processes for execute_python, with per-run timeouts and a bounded wait queue.
+
+import json
+import os
+import queue
+import select
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+
+from backend.core.runtime import CHROMA_DB_DIR
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(__file__), "sandbox_worker.py")
+
+SANDBOX_WORKERS = int(os.getenv("SANDBOX_WORKERS", "2"))
+# Runs allowed to wait for a free worker, and for how long, before the call is refused
+SANDBOX_MAX_QUEUE = int(os.getenv("SANDBOX_MAX_QUEUE", "8"))
+SANDBOX_QUEUE_TIMEOUT = float(os.getenv("SANDBOX_QUEUE_TIMEOUT", "30"))
+SANDBOX_TIMEOUT_S = float(os.getenv("SANDBOX_TIMEOUT_S", "30"))
+SANDBOX_CPU_SECONDS = float(os.getenv("SANDBOX_CPU_SECONDS", "20"))
+# Workers are replaced after this many runs so state left behind by user code cannot accumulate
+SANDBOX_MAX_RUNS = int(os.getenv("SANDBOX_MAX_RUNS", "100"))
+# Sandbox processes run at lower CPU priority than the API so analytics bursts don't slow chat
+SANDBOX_NICE = int(os.getenv("SANDBOX_NICE", "10"))
+WORKER_START_TIMEOUT = 60.0
+
+# Credentials the API holds but sandboxed code has no business reading
+_SECRET_SUFFIXES = ("_KEY", "_TOKEN", "_SECRET", "_PASSWORD")
+
+
+def _worker_env() -> dict:
+    env = {name: value for name, value in os.environ.items() if not name.upper().endswith(_SECRET_SUFFIXES)}
+    # Shared by all workers so one worker's fetch is a cache hit for the others
+    env.setdefault("SANDBOX_HTTP_CACHE_DIR", os.path.join(CHROMA_DB_DIR, "http_cache"))
+    # Applied by the worker itself: a preexec_fn would make Popen fork unsafely from this threaded process
+    env["SANDBOX_NICE"] = str(SANDBOX_NICE)
+    return env
+
+
+class SandboxWorker:
+    """One sandbox process. Runs one request at a time; killed and replaced on timeout."""
+
+    def __init__(self):
+        self.runs = 0
+        self.process = subprocess.Popen(
+            [sys.executable, "-u", WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            env=_worker_env(),
+        )
+        ready = self._read(WORKER_START_TIMEOUT)
+        if ready is None or ready.get("status") != "ready":
+            self.kill()
+            raise RuntimeError("Sandbox worker failed to start")
+
+    def _read(self, timeout: float):
+        readable, _, _ = select.select([self.process.stdout], [], [], timeout)
+        if not readable:
+            return None
+        line = self.process.stdout.readline()
+        return json.loads(line) if line else None
+
+    def run(self, code: str, timeout: float, cpu_seconds: float, current_date: str):
+        """
+        Result dict from the worker, or None if it timed out or died (the caller then discards it).
+        `delivered` tells whether the request reached the worker at all.
+        """
+        self.runs += 1
+        self.delivered = False
+        if not self.alive():
+            return None
+        request = {"code": code, "cpu_seconds": cpu_seconds, "current_date": current_date}
+        try:
+            self.process.stdin.write(json.dumps(request) + "\n")
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError, ValueError):
+            return None
+        self.delivered = True
+        try:
+            return self._read(timeout)
+        except (OSError, ValueError):
+            return None
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def kill(self) -> None:
+        if self.alive():
+            self.process.kill()
+        self.process.wait()
+
+
+class SandboxPool:
+    """
+    SANDBOX_WORKERS processes started ahead of time with pandas/requests/math/datetime imported.
+    A run borrows an idle worker, waiting in a bounded queue when all are busy. A run that exceeds its
+    timeout has its worker killed, and a replacement is started in the background.
+    """
+
+    def __init__(self, size: int = SANDBOX_WORKERS, max_queue: int = SANDBOX_MAX_QUEUE, queue_timeout: float = SANDBOX_QUEUE_TIMEOUT):
+        self.size = size
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+        self._closed = False
+        self.waiting = 0
+        self.active = 0
+        self.completed = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.restarts = 0
+        self.http = Counter()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        # Start the workers in parallel; each one pays the pandas import once
+        threads = [threading.Thread(target=self._add_worker, daemon=True) for _ in range(self.size)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _add_worker(self) -> None:
+        try:
+            worker = SandboxWorker()
+        except Exception as e:
+            print(f"[sandbox] could not start worker: {e}")
+            return
+        if self._closed:
+            worker.kill()
+            return
+        self._idle.put(worker)
+
+    def _replace(self, worker: SandboxWorker) -> None:
+        worker.kill()
+        with self._lock:
+            self.restarts += 1
+        threading.Thread(target=self._add_worker, daemon=True).start()
+
+    def _respawn(self, worker: SandboxWorker):
+        """Replaces a worker that died while idle in this thread, so the run can go ahead; None if that fails."""
+        worker.kill()
+        with self._lock:
+            self.restarts += 1
+        try:
+            return SandboxWorker()
+        except Exception as e:
+            print(f"[sandbox] could not restart worker: {e}")
+            # Keep the pool at full size for later runs
+            threading.Thread(target=self._add_worker, daemon=True).start()
+            return None
+
+    def run(self, code: str, current_date: str, timeout: float = SANDBOX_TIMEOUT_S, cpu_seconds: float = SANDBOX_CPU_SECONDS) -> dict:
+        """{"status", "output", "error"?, "queue_s"}; status is ok, error, timeout, cpu_limit, memory_limit or busy."""
+        self.start()
+        with self._lock:
+            if self.waiting >= self.max_queue and self._idle.empty():
+                self.rejected += 1
+                return {"status": "busy", "output": "", "error": "all sandbox workers are busy and the queue is full", "queue_s": 0.0}
+            self.waiting += 1
+        queued = time.perf_counter()
+        try:
+            worker = self._idle.get(timeout=self.queue_timeout)
+        except queue.Empty:
+            with self._lock:
+                self.rejected += 1
+            return {"status": "busy", "output": "", "error": f"no sandbox worker free within {self.queue_timeout:g}s", "queue_s": self.queue_timeout}
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        queue_s = round(time.perf_counter() - queued, 4)
+
+        with self._lock:
+            self.active += 1
+        try:
+            result = worker.run(code, timeout, cpu_seconds, current_date)
+            if result is None and not worker.delivered:
+                # The worker died while idle (OOM killer, stray signal), not on this code: retry once on a fresh one
+                worker = self._respawn(worker)
+                if worker is None:
+                    return {"status": "error", "output": "", "error": "sandbox worker crashed", "queue_s": queue_s}
+                result = worker.run(code, timeout, cpu_seconds, current_date)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+        if result is None:
+            timed_out = worker.alive()
+            with self._lock:
+                self.timeouts += timed_out
+            self._replace(worker)
+            if timed_out:
+                return {"status": "timeout", "output": "", "error": f"execution exceeded {timeout:g}s and was cancelled", "queue_s": queue_s}
+            return {"status": "error", "output": "", "error": "sandbox worker crashed", "queue_s": queue_s}
+
+        with self._lock:
+            self.completed += 1
+            self.http.update(result.pop("http", {}))
+        if result.pop("recycle", False) or worker.runs >= SANDBOX_MAX_RUNS:
+            self._replace(worker)
+        else:
+            self._idle.put(worker)
+        result["queue_s"] = queue_s
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.size,
+            "idle": self._idle.qsize(),
+            "active": self.active,
+            "waiting": self.waiting,
+            "max_queue": self.max_queue,
+            "completed": self.completed,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "restarts": self.restarts,
+            "http_cache_hits": self.http["hits"],
+            "http_cache_misses": self.http["misses"],
+            "http_replayed": self.http["replayed"],
+        }
+
+    def shutdown(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().kill()
+            except queue.Empty:
+                break
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_sandbox_pool() -> SandboxPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SandboxPool()
+        return _pool
@@ -0,0 +1,114 @@
+# backend/core/sandbox_worker.py
+# Long-lived sandbox process started by sandbox_pool.py. Runs as a plain script (no backend imports) and talks
+# JSON lines: one {"code", "cpu_seconds", "current_date"} request on stdin, one result on the protocol stream.
+
+import io
+import json
+import os
+import resource
+import signal
+import sys
+import traceback
+
+# Lower CPU priority before the heavy imports, so analytics bursts don't slow the API (set by the pool)
+os.nice(int(os.getenv("SANDBOX_NICE", "0")))
+
+# Pre-loaded once per worker so each run skips the pandas import
+import datetime
+import math
+import pandas as pd
+
+# Lives next to this script, which is on sys.path when the worker is started
+from sandbox_http import CachedHTTPClient
+
+MEMORY_LIMIT_MB = int(os.getenv("SANDBOX_MEMORY_MB", "1024"))
+MAX_OUTPUT_CHARS = int(os.getenv("SANDBOX_MAX_OUTPUT_CHARS", "20000"))
+
+# Stands in for the `requests` module: pooled connections and cached/replayed GETs, shared by every run
+http_client = CachedHTTPClient()
+
+
+class CPULimitExceeded(Exception):
+    pass
+
+
+def _on_cpu_limit(signum, frame):
+    raise CPULimitExceeded("CPU time limit exceeded")
+
+
+def _cpu_used() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _limit_memory():
+    """Caps the address space at what the pre-loaded imports already use plus SANDBOX_MEMORY_MB."""
+    try:
+        with open("/proc/self/statm") as f:
+            current = int(f.read().split()[0]) * resource.getpagesize()
+    except OSError:
+        current = 0
+    limit = current + MEMORY_LIMIT_MB * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def run(code: str, cpu_seconds: float, current_date: str) -> dict:
+    output = io.StringIO()
+    exec_globals = {
+        "pd": pd,
+        "requests": http_client,
+        "math": math,
+        "datetime": datetime,
+        # EXPLICIT DATE INJECTION
+        "CURRENT_DATE": current_date,
+        "print": print,
+        "__builtins__": __builtins__,
+    }
+    # Soft limit only: the hard limit stays unlimited so it can be raised again for the next run
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = int(_cpu_used() + cpu_seconds) + 1
+    resource.setrlimit(resource.RLIMIT_CPU, (soft if hard == resource.RLIM_INFINITY else min(soft, hard), hard))
+    # One run at a time per process, so swapping sys.stdout cannot mix output between runs
+    previous_stdout, sys.stdout = sys.stdout, output
+    http_before = dict(http_client.stats)
+    try:
+        exec(code, exec_globals)
+        result = {"status": "ok"}
+    except CPULimitExceeded:
+        result = {"status": "cpu_limit", "error": f"CPU time limit of {cpu_seconds:g}s exceeded", "recycle": True}
+    except MemoryError:
+        result = {"status": "memory_limit", "error": f"Memory limit of {MEMORY_LIMIT_MB} MB exceeded", "recycle": True}
+    except Exception as e:
+        result = {"status": "error", "error": str(e)}
+    finally:
+        sys.stdout = previous_stdout
+        resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+    text = output.getvalue()
+    if len(text) > MAX_OUTPUT_CHARS:
+        text = text[:MAX_OUTPUT_CHARS] + f"\n... [output truncated at {MAX_OUTPUT_CHARS} characters]"
+    result["output"] = text
+    result["http"] = {name: http_client.stats[name] - http_before[name] for name in http_before}
+    return result
+
+
+def main():
+    # Keep the protocol on a private copy of stdout; anything else writing to fd 1 (C extensions) goes to stderr
+    protocol = os.fdopen(os.dup(1), "w", buffering=1)
+    os.dup2(2, 1)
+    sys.stdout = os.fdopen(1, "w", buffering=1)
+
+    signal.signal(signal.SIGXCPU, _on_cpu_limit)
+    _limit_memory()
+    protocol.write(json.dumps({"status": "ready", "pid": os.getpid()}) + "\n")
+
+    for line in sys.stdin:
+        try:
+            request = json.loads(line)
+            result = run(request["code"], float(request["cpu_seconds"]), request["current_date"])
+        except Exception:
+            result = {"status": "error", "error": traceback.format_exc(limit=1), "output": "", "recycle": True}
+        protocol.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
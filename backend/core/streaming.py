@@ -0,0 +1,77 @@
+# backend/core/streaming.py
+# Turns the agent's LangGraph stream into Server-Sent Events for /api/chat/stream.
+
+import json
+import re
+from typing import AsyncIterator
+
+CITATION_PATTERN = re.compile(r"\[Source:\s*([^,\]]+),\s*Chunk:\s*([^\]]+)\]")
+
+
+def message_text(content) -> str:
+    """Flattens LangChain message content (plain string or list of content blocks) into text."""
+    if isinstance(content, list):
+        return "".join(
+            block["text"] for block in content if isinstance(block, dict) and "text" in block
+        )
+    return content or ""
+
+
+def extract_citations(text: str) -> list:
+    """Pulls unique [Source: ..., Chunk: ...] citations out of tool output, in order of appearance."""
+    citations = []
+    seen = set()
+    for source, chunk_id in CITATION_PATTERN.findall(text):
+        key = (source.strip(), chunk_id.strip())
+        if key not in seen:
+            seen.add(key)
+            citations.append({"source": key[0], "chunk_id": key[1]})
+    return citations
+
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def stream_agent_events(agent, inputs: dict, config: dict = None) -> AsyncIterator[tuple]:
+    """
+    Yields (event, data) pairs while the agent runs:
+      token       - a fragment of model output as it is generated
+      tool_start  - the model requested a tool call
+      tool_end    - a tool returned (with a short preview of its output)
+      citations   - citations found in a search_documents result
+      done        - the final reply text
+    """
+    final_reply = ""
+    async for mode, chunk in agent.astream(inputs, config=config, stream_mode=["messages", "updates"]):
+        if mode == "messages":
+            message, metadata = chunk
+            # Only stream model tokens; tool output is reported through tool_end instead
+            if metadata.get("langgraph_node") != "model":
+                continue
+            text = message_text(message.content)
+            if text:
+                yield "token", {"text": text}
+            continue
+
+        for node, update in (chunk or {}).items():
+            for message in (update or {}).get("messages", []):
+                tool_calls = getattr(message, "tool_calls", None)
+                if node == "model" and tool_calls:
+                    for call in tool_calls:
+                        yield "tool_start", {"id": call.get("id"), "name": call.get("name"), "args": call.get("args")}
+                elif node == "model":
+                    final_reply = message_text(message.content)
+                elif node == "tools":
+                    output = message_text(message.content)
+                    yield "tool_end", {
+                        "id": getattr(message, "tool_call_id", None),
+                        "name": getattr(message, "name", None),
+                        "status": getattr(message, "status", "success"),
+                        "preview": output[:200],
+                    }
+                    citations = extract_citations(output)
+                    if citations:
+                        yield "citations", {"citations": citations}
+
+    yield "done", {"reply": final_reply}
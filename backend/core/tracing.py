@@ -0,0 +1,312 @@
+# backend/core/tracing.py
+# Per-request span tracing, Prometheus-style metrics and an opt-in sampling profiler for slow requests.
+
+import contextvars
+import os
+import sys
+import threading
+import time
+import traceback
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Record a folded-stack profile for requests slower than this (0 disables the profiler)
+PROFILE_SLOW_REQUESTS_MS = float(os.getenv("PROFILE_SLOW_REQUESTS_MS", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv(
+    "PROFILE_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "artifacts", "profiles")
+)
+
+HISTOGRAM_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+# --- Metrics registry ---
+class MetricsRegistry:
+    """Minimal counters and histograms rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+        self._collectors = []
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": [0] * len(HISTOGRAM_BUCKETS), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(HISTOGRAM_BUCKETS):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def register_collector(self, collector) -> None:
+        """`collector()` returns (name, value, labels) gauge samples computed at scrape time."""
+        self._collectors.append(collector)
+
+    @staticmethod
+    def _labels(labels, extra=()) -> str:
+        items = list(labels) + list(extra)
+        if not items:
+            return ""
+        return "{" + ",".join(f'{key}="{str(value)}"' for key, value in items) + "}"
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: {**value, "buckets": list(value["buckets"])} for key, value in self._histograms.items()}
+
+        for name in sorted({name for name, _ in counters}):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} counter")
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{self._labels(labels)} {value}")
+
+        for name in sorted({name for name, _ in histograms}):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} histogram")
+            for (metric, labels), histogram in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(HISTOGRAM_BUCKETS, histogram["buckets"]):
+                    lines.append(f"{name}_bucket{self._labels(labels, [('le', bound)])} {count}")
+                lines.append(f"{name}_bucket{self._labels(labels, [('le', '+Inf')])} {histogram['count']}")
+                lines.append(f"{name}_sum{self._labels(labels)} {histogram['sum']}")
+                lines.append(f"{name}_count{self._labels(labels)} {histogram['count']}")
+
+        gauges = {}
+        for collector in self._collectors:
+            try:
+                for name, value, labels in collector():
+                    gauges.setdefault(name, []).append((value, labels))
+            except Exception:
+                continue
+        for name in sorted(gauges):
+            lines.append(f"# TYPE {name} gauge")
+            for value, labels in gauges[name]:
+                lines.append(f"{name}{self._labels(sorted(labels.items()))} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+METRICS.describe("rag_span_duration_seconds", "Duration of traced spans (agent steps, tools, retrieval, ingestion).")
+METRICS.describe("rag_llm_tokens_total", "Tokens consumed by LLM calls, by kind (input/output/cache_read).")
+METRICS.describe("rag_llm_calls_total", "LLM calls by model.")
+METRICS.describe("rag_http_request_duration_seconds", "HTTP request latency by route and status (until the last event, for streams).")
+
+
+# --- Per-request traces ---
+class Trace:
+    """Spans recorded while serving one request; appended to from the event loop and worker threads."""
+
+    def __init__(self, trace_id: str = None):
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.started = time.perf_counter()
+        self.spans = []
+        self.tokens = {"input": 0, "output": 0, "cache_read": 0}
+
+    def add(self, name: str, start: float, duration: float, **attrs) -> None:
+        self.spans.append({
+            "name": name,
+            "start_ms": round((start - self.started) * 1000, 2),
+            "duration_ms": round(duration * 1000, 2),
+            **attrs,
+        })
+
+    def breakdown(self) -> dict:
+        """Total time per span name plus the raw span list, for the optional per-response timing block."""
+        totals = {}
+        for entry in self.spans:
+            total = totals.setdefault(entry["name"], {"count": 0, "total_ms": 0.0})
+            total["count"] += 1
+            total["total_ms"] = round(total["total_ms"] + entry["duration_ms"], 2)
+        return {
+            "trace_id": self.trace_id,
+            "elapsed_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            "llm_tokens": dict(self.tokens),
+            "by_span": totals,
+            "spans": sorted(self.spans, key=lambda entry: entry["start_ms"]),
+        }
+
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+def start_trace(trace_id: str = None) -> Trace:
+    trace = Trace(trace_id)
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def record_span(name: str, start: float, duration: float, trace: Trace = None, **attrs) -> None:
+    METRICS.observe("rag_span_duration_seconds", duration, span=name)
+    trace = trace or _current_trace.get()
+    if trace is not None:
+        trace.add(name, start, duration, **attrs)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Times the enclosed block into the current request trace and the span histogram."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, start, time.perf_counter() - start, **attrs)
+
+
+# --- LangChain integration ---
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    Turns LangChain/LangGraph callbacks into spans: one per agent step (graph node),
+    one per tool call and one per LLM call, with token usage from the provider response.
+    """
+
+    def __init__(self, trace: Trace = None):
+        self.trace = trace or current_trace()
+        self._starts = {}
+
+    def _begin(self, run_id, name):
+        self._starts[run_id] = (name, time.perf_counter())
+
+    def _end(self, run_id, **attrs):
+        entry = self._starts.pop(run_id, None)
+        if entry is not None:
+            name, start = entry
+            record_span(name, start, time.perf_counter() - start, trace=self.trace, **attrs)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        # Only the graph node itself, not the runnables nested inside it
+        if node and kwargs.get("name") == node:
+            self._begin(run_id, f"agent.step.{node}")
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=type(error).__name__)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._begin(run_id, f"tool.{(serialized or {}).get('name') or kwargs.get('name', 'unknown')}")
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=type(error).__name__)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._begin(run_id, "llm.call")
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._begin(run_id, "llm.call")
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        input_tokens, output_tokens, cached_tokens, model = _token_usage(response)
+        METRICS.inc("rag_llm_calls_total", model=model)
+        METRICS.inc("rag_llm_tokens_total", input_tokens, kind="input")
+        METRICS.inc("rag_llm_tokens_total", output_tokens, kind="output")
+        METRICS.inc("rag_llm_tokens_total", cached_tokens, kind="cache_read")
+        if self.trace is not None:
+            self.trace.tokens["input"] += input_tokens
+            self.trace.tokens["output"] += output_tokens
+            self.trace.tokens["cache_read"] += cached_tokens
+        self._end(run_id, input_tokens=input_tokens, output_tokens=output_tokens, cached_tokens=cached_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=type(error).__name__)
+
+
+def _token_usage(response) -> tuple:
+    """
+    (input_tokens, output_tokens, cached_input_tokens, model) from message usage_metadata, falling back to
+    llm_output. Cached tokens are the prompt prefix the provider served from its prompt cache.
+    """
+    llm_output = response.llm_output or {}
+    model = llm_output.get("model_name") or llm_output.get("model") or "unknown"
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                cached = (usage.get("input_token_details") or {}).get("cache_read", 0)
+                return usage.get("input_tokens", 0), usage.get("output_tokens", 0), cached or 0, model
+    usage = llm_output.get("token_usage") or llm_output.get("usage") or {}
+    cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+    return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), cached or 0, model
+
+
+# --- Sampling profiler ---
+class SlowRequestProfiler:
+    """
+    Samples every thread's stack each PROFILE_INTERVAL_MS while a request runs. If the request ends up
+    slower than PROFILE_SLOW_REQUESTS_MS the samples are written as folded stacks (flamegraph.pl / speedscope).
+    Samples cover the whole process, so concurrent requests show up in each other's profiles.
+    """
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"profiler-{trace_id}", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(PROFILE_INTERVAL_MS / 1000):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = [f"{entry.name} ({os.path.basename(entry.filename)}:{entry.lineno})" for entry in traceback.extract_stack(frame)]
+                self.samples[";".join(stack)] += 1
+
+    def dump(self) -> str:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{self.trace_id}.folded")
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+@contextmanager
+def maybe_profile(trace_id: str):
+    """Profiles the enclosed request when PROFILE_SLOW_REQUESTS_MS is set; yields the profile path holder."""
+    result = {"profile": None}
+    if PROFILE_SLOW_REQUESTS_MS <= 0:
+        yield result
+        return
+    start = time.perf_counter()
+    with SlowRequestProfiler(trace_id) as profiler:
+        yield result
+    if (time.perf_counter() - start) * 1000 >= PROFILE_SLOW_REQUESTS_MS:
+        result["profile"] = profiler.dump()
@@ -0,0 +1,874 @@
+# backend/core/vector_index.py
+# Vector index abstraction behind ingestion and retrieval: Chroma (HNSW) or an in-process NumPy flat index.
+
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+import numpy as np
+from langchain_core.documents import Document
+
+from backend.core.runtime import CHROMA_DB_DIR, get_vectorstore
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the Chroma backend is available
+    fcntl = None
+
+# "chroma" (HNSW, scales to large corpora), "numpy" (exact brute force, fastest for small corpora)
+# or "compressed" (memory-mapped int8/float16 vectors with full-precision rescoring, for corpora larger than RAM)
+VECTOR_INDEX_BACKEND = os.getenv("VECTOR_INDEX_BACKEND", "chroma")
+FLAT_INDEX_DIR = os.path.join(CHROMA_DB_DIR, "flat_index")
+COMPRESSED_INDEX_DIR = os.path.join(CHROMA_DB_DIR, "compressed_index")
+
+# "int8" (4x smaller, per-row scale) or "float16" (2x smaller, near-lossless)
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "int8")
+# Candidates rescored at full precision per requested result
+RESCORE_FACTOR = int(os.getenv("RESCORE_FACTOR", "4"))
+# Rows scored per step of a compressed scan; bounds the float32 working set of a search
+SCAN_BLOCK_ROWS = int(os.getenv("SCAN_BLOCK_ROWS", "65536"))
+QUANTIZED_DTYPES = {"int8": np.int8, "float16": np.float16}
+
+
+def _require_fcntl(backend: str) -> None:
+    if fcntl is None:
+        raise RuntimeError(f"{backend} coordinates writers with fcntl file locks; use VECTOR_INDEX_BACKEND=chroma on this platform")
+
+
+def build_where(source: str = None, tags: list = None, uploaded_after: float = None, uploaded_before: float = None):
+    """
+    Builds a Chroma-style `where` filter from the supported metadata fields.
+    Tags are stored as one boolean key per tag ("tag:finance": True) because metadata values must be scalars.
+    """
+    clauses = []
+    if source:
+        clauses.append({"source": source})
+    for tag in tags or []:
+        clauses.append({f"tag:{tag}": True})
+    if uploaded_after is not None:
+        clauses.append({"uploaded_at": {"$gte": uploaded_after}})
+    if uploaded_before is not None:
+        clauses.append({"uploaded_at": {"$lte": uploaded_before}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+class VectorIndex:
+    """Interface shared by the index backends. Scores are similarities: higher is more relevant."""
+
+    def upsert(self, ids: list, embeddings: list, documents: list, metadatas: list) -> None:
+        raise NotImplementedError
+
+    def delete(self, ids: list) -> None:
+        raise NotImplementedError
+
+    def get_embeddings(self, ids: list) -> dict:
+        raise NotImplementedError
+
+    def ids_where(self, where: dict, ids: list = None) -> list:
+        """Ids (optionally restricted to `ids`) whose metadata matches `where`."""
+        raise NotImplementedError
+
+    def search(self, embedding: list, k: int, where: dict = None) -> list:
+        """Top-k (Document, score) pairs, with `where` applied before ranking."""
+        raise NotImplementedError
+
+    def page(self, offset: int, limit: int) -> dict:
+        """{"ids", "documents", "metadatas"} for a slice of the index, used to rebuild derived indexes."""
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {"backend": type(self).__name__, "count": self.count()}
+
+
+class ChromaVectorIndex(VectorIndex):
+    """
+    Chroma's HNSW index. Graph parameters (HNSW_M, HNSW_CONSTRUCTION_EF, HNSW_SEARCH_EF, HNSW_SPACE) are
+    applied when the collection is first created. Chroma evaluates `where` filters inside the query.
+    """
+
+    def __init__(self):
+        self.vectorstore = get_vectorstore()
+        self.collection = self.vectorstore._collection
+        self.space = (self.collection.metadata or {}).get("hnsw:space", "l2")
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def delete(self, ids):
+        if ids:
+            self.collection.delete(ids=ids)
+
+    def get_embeddings(self, ids):
+        stored = self.collection.get(ids=ids, include=["embeddings"])
+        return dict(zip(stored["ids"], stored["embeddings"]))
+
+    def ids_where(self, where, ids=None):
+        return self.collection.get(ids=ids, where=where, include=[])["ids"]
+
+    def _similarity(self, distance: float) -> float:
+        # MiniLM vectors are unit length, so both spaces map cleanly onto cosine similarity
+        if self.space == "cosine":
+            return 1.0 - distance
+        if self.space == "ip":
+            return -distance
+        return 1.0 - distance / 2.0
+
+    def search(self, embedding, k, where=None):
+        result = self.collection.query(
+            query_embeddings=[list(embedding)],
+            n_results=k,
+            where=where,
+            include=["documents", "metadatas", "distances"],
+        )
+        return [
+            (Document(page_content=text, metadata=metadata or {}), self._similarity(distance))
+            for text, metadata, distance in zip(result["documents"][0], result["metadatas"][0], result["distances"][0])
+        ]
+
+    def page(self, offset, limit):
+        return self.collection.get(offset=offset, limit=limit, include=["documents", "metadatas"])
+
+    def count(self):
+        return self.collection.count()
+
+
+class NumpyFlatIndex(VectorIndex):
+    """
+    Exact in-process index: one normalized float32 matrix scored with a single matmul.
+    Metadata filters become boolean masks over per-field columns, so only matching rows are scored.
+    Persisted append-only to FLAT_INDEX_DIR, so a write costs only the rows it touches:
+      vectors.f32    one float32 row per position, overwritten in place when a chunk is re-ingested
+      records.jsonl  a log of puts (id, position, text, metadata) and deletes, replayed on load
+    Writers hold a file lock; API workers sharing the directory replay each other's new log entries before reading.
+    Suited to corpora up to a few hundred thousand chunks.
+    """
+
+    # The log is rewritten without superseded entries once it holds this many times the live rows
+    LOG_COMPACT_RATIO = 3
+
+    def __init__(self, directory: str = FLAT_INDEX_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._reset()
+        with self._file_lock():
+            self._replay()
+            self._migrate_legacy()
+
+    # --- persistence ---
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _reset(self):
+        self.dim = None
+        self.rows = 0
+        self.ids = []
+        self.documents = []
+        self.metadatas = []
+        self._buffer = np.zeros((0, 0), dtype=np.float32)
+        self._live = np.zeros(0, dtype=bool)
+        self._positions = {}
+        self._columns = {}
+        self._log_inode = None
+        self._log_offset = 0
+        self._log_entries = 0
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._buffer[:self.rows]
+
+    @contextmanager
+    def _file_lock(self, shared: bool = False):
+        _require_fcntl(type(self).__name__)
+        mode = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        with open(self._path("write.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _reserve(self, rows: int):
+        # Grow geometrically so appending a batch doesn't copy the whole matrix every time
+        if rows > len(self._buffer):
+            capacity = max(rows, 2 * len(self._buffer), 1024)
+            buffer = np.zeros((capacity, self.dim), dtype=np.float32)
+            buffer[:self.rows] = self._buffer[:self.rows]
+            live = np.zeros(capacity, dtype=bool)
+            live[:self.rows] = self._live[:self.rows]
+            self._buffer, self._live = buffer, live
+        if rows > self.rows:
+            grow = rows - self.rows
+            self.ids += [None] * grow
+            self.documents += [None] * grow
+            self.metadatas += [None] * grow
+            self.rows = rows
+
+    def _apply(self, entry: dict, vector=None):
+        if entry["op"] == "dim":
+            self.dim = entry["dim"]
+            self._buffer = np.zeros((0, self.dim), dtype=np.float32)
+        elif entry["op"] == "put":
+            chunk_id, position = entry["id"], entry["position"]
+            previous = self._positions.get(chunk_id)
+            if previous is not None and previous != position:
+                self._live[previous] = False
+            self._reserve(position + 1)
+            self.ids[position], self.documents[position], self.metadatas[position] = chunk_id, entry["document"], entry["metadata"]
+            self._buffer[position] = vector
+            self._live[position] = True
+            self._positions[chunk_id] = position
+        elif entry["op"] == "delete":
+            position = self._positions.pop(entry["id"], None)
+            if position is not None:
+                self._live[position] = False
+                self.documents[position] = self.metadatas[position] = None
+        self._log_entries += 1
+
+    def _replay(self):
+        """Applies log entries written since the last replay (by this or another process)."""
+        log_path = self._path("records.jsonl")
+        try:
+            stat = os.stat(log_path)
+        except FileNotFoundError:
+            if self._log_inode is not None:
+                self._reset()
+            return
+        if stat.st_ino != self._log_inode or stat.st_size < self._log_offset:
+            # Rewritten by a log compaction elsewhere: start over
+            self._reset()
+            self._log_inode = stat.st_ino
+        if stat.st_size == self._log_offset:
+            return
+        with open(log_path, "rb") as f:
+            f.seek(self._log_offset)
+            data = f.read(stat.st_size - self._log_offset)
+        complete = data.rfind(b"\n") + 1
+        entries = [json.loads(line) for line in data[:complete].splitlines() if line]
+        self._log_offset += complete
+        for entry in entries:
+            if entry["op"] == "dim":
+                self._apply(entry)
+        puts = [entry["position"] for entry in entries if entry["op"] == "put"]
+        vectors = {}
+        if puts:
+            stored = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r").reshape(-1, self.dim)
+            vectors = dict(zip(puts, np.array(stored[puts])))
+            del stored
+        for entry in entries:
+            if entry["op"] != "dim":
+                self._apply(entry, vectors.get(entry.get("position")))
+        self._columns = {}
+
+    def _refresh(self):
+        """Catches up with writes from other processes; a stat() when nothing changed."""
+        try:
+            stat = os.stat(self._path("records.jsonl"))
+        except FileNotFoundError:
+            return
+        if stat.st_ino != self._log_inode or stat.st_size != self._log_offset:
+            with self._file_lock(shared=True):
+                self._replay()
+
+    def _write(self, entries: list, vectors: dict) -> None:
+        """Persists entries (and the vectors of their puts) in the order readers replay them: vectors first, then the log."""
+        if vectors:
+            row_bytes = (self.dim or entries[0]["dim"]) * 4
+            with open(self._path("vectors.f32"), "r+b" if os.path.exists(self._path("vectors.f32")) else "wb") as f:
+                for position in sorted(vectors):
+                    f.seek(position * row_bytes)
+                    f.write(np.ascontiguousarray(vectors[position], dtype=np.float32).tobytes())
+        with open(self._path("records.jsonl"), "ab") as f:
+            f.write("".join(json.dumps(entry) + "\n" for entry in entries).encode("utf-8"))
+            self._log_offset = f.tell()
+        self._log_inode = os.stat(self._path("records.jsonl")).st_ino
+        for entry in entries:
+            self._apply(entry, vectors.get(entry.get("position")))
+        self._columns = {}
+        if self._log_entries > self.LOG_COMPACT_RATIO * max(len(self._positions), 1000):
+            self._compact_log()
+
+    def _compact_log(self) -> None:
+        """Rewrites both files with live rows only. Called with the exclusive file lock held."""
+        keep = np.flatnonzero(self._live[:self.rows])
+        entries = [{"op": "dim", "dim": self.dim}] + [
+            {"op": "put", "id": self.ids[old], "position": new, "document": self.documents[old], "metadata": self.metadatas[old]}
+            for new, old in enumerate(keep)
+        ]
+        vectors = self._buffer[keep]
+        with open(self._path("vectors.f32.tmp"), "wb") as f:
+            f.write(np.ascontiguousarray(vectors).tobytes())
+        with open(self._path("records.jsonl.tmp"), "wb") as f:
+            f.write("".join(json.dumps(entry) + "\n" for entry in entries).encode("utf-8"))
+        os.replace(self._path("vectors.f32.tmp"), self._path("vectors.f32"))
+        os.replace(self._path("records.jsonl.tmp"), self._path("records.jsonl"))
+        self._reset()
+        self._replay()
+
+    def _migrate_legacy(self) -> None:
+        """Converts a store written as vectors.npy + records.json (one full rewrite per batch) to the log format."""
+        vectors_path, records_path = self._path("vectors.npy"), self._path("records.json")
+        if self.dim is not None or not (os.path.exists(vectors_path) and os.path.exists(records_path)):
+            return
+        with open(records_path, "r") as f:
+            records = json.load(f)
+        if records["ids"]:
+            self._upsert_locked(records["ids"], np.load(vectors_path), records["documents"], records["metadatas"])
+        os.remove(vectors_path)
+        os.remove(records_path)
+
+    def _column(self, key: str):
+        # Built lazily per metadata key and dropped on every write
+        if key not in self._columns:
+            self._columns[key] = np.array([(metadata or {}).get(key) for metadata in self.metadatas], dtype=object)
+        return self._columns[key]
+
+    # --- filtering ---
+    def _mask(self, where: dict):
+        mask = np.ones(self.rows, dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self._mask(clause)
+            elif key == "$or":
+                any_mask = np.zeros(self.rows, dtype=bool)
+                for clause in condition:
+                    any_mask |= self._mask(clause)
+                mask &= any_mask
+            elif isinstance(condition, dict):
+                column = self._column(key)
+                present = column != None  # noqa: E711 - elementwise comparison on an object array
+                for op, value in condition.items():
+                    if op == "$eq":
+                        mask &= column == value
+                    elif op == "$ne":
+                        mask &= column != value
+                    elif op == "$in":
+                        mask &= np.isin(column, list(value))
+                    elif op in ("$gt", "$gte", "$lt", "$lte"):
+                        values = np.where(present, column, np.nan).astype(float)
+                        compare = {"$gt": np.greater, "$gte": np.greater_equal, "$lt": np.less, "$lte": np.less_equal}[op]
+                        mask &= present & compare(values, value)
+                    else:
+                        raise ValueError(f"Unsupported filter operator: {op}")
+            else:
+                mask &= self._column(key) == condition
+        return mask
+
+    def _live_mask(self, where: dict = None):
+        live = self._live[:self.rows].copy()
+        return live & self._mask(where) if where else live
+
+    # --- VectorIndex ---
+    def upsert(self, ids, embeddings, documents, metadatas):
+        with self._lock, self._file_lock():
+            self._replay()
+            self._upsert_locked(ids, embeddings, documents, metadatas)
+
+    def _upsert_locked(self, ids, embeddings, documents, metadatas):
+        vectors = normalize_rows(embeddings)
+        entries = []
+        if self.dim is None:
+            entries.append({"op": "dim", "dim": int(vectors.shape[1])})
+        # Last write wins if an id repeats within the batch
+        latest = {chunk_id: i for i, chunk_id in enumerate(ids)}
+        placed, next_position = {}, self.rows
+        for chunk_id, i in latest.items():
+            position = self._positions.get(chunk_id)
+            if position is None:
+                position, next_position = next_position, next_position + 1
+            placed[position] = vectors[i]
+            entries.append({"op": "put", "id": chunk_id, "position": position, "document": documents[i], "metadata": metadatas[i] or {}})
+        self._write(entries, placed)
+
+    def delete(self, ids):
+        with self._lock, self._file_lock():
+            self._replay()
+            entries = [{"op": "delete", "id": chunk_id} for chunk_id in dict.fromkeys(ids) if chunk_id in self._positions]
+            if entries:
+                self._write(entries, {})
+
+    def get_embeddings(self, ids):
+        with self._lock:
+            self._refresh()
+            return {chunk_id: self._buffer[self._positions[chunk_id]].copy() for chunk_id in ids if chunk_id in self._positions}
+
+    def ids_where(self, where, ids=None):
+        with self._lock:
+            self._refresh()
+            mask = self._live_mask(where)
+            if ids is None:
+                return [self.ids[i] for i in np.flatnonzero(mask)]
+            return [chunk_id for chunk_id in ids if chunk_id in self._positions and mask[self._positions[chunk_id]]]
+
+    def search(self, embedding, k, where=None):
+        with self._lock:
+            self._refresh()
+            if not self._positions:
+                return []
+            candidates = np.flatnonzero(self._live_mask(where))
+            if candidates.size == 0:
+                return []
+            query = np.asarray(embedding, dtype=np.float32)
+            query = query / max(float(np.linalg.norm(query)), 1e-12)
+            scores = self._buffer[candidates] @ query
+            top = np.argsort(-scores)[:k] if scores.size > k else np.argsort(-scores)
+            return [
+                (Document(page_content=self.documents[candidates[i]], metadata=self.metadatas[candidates[i]]), float(scores[i]))
+                for i in top
+            ]
+
+    def page(self, offset, limit):
+        with self._lock:
+            self._refresh()
+            positions = np.flatnonzero(self._live[:self.rows])[offset:offset + limit]
+            return {
+                "ids": [self.ids[i] for i in positions],
+                "documents": [self.documents[i] for i in positions],
+                "metadatas": [self.metadatas[i] for i in positions],
+            }
+
+    def count(self):
+        with self._lock:
+            self._refresh()
+            return len(self._positions)
+
+
+def normalize_rows(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+def quantize(vectors: np.ndarray, quantization: str) -> tuple:
+    """(codes, scales) for unit-length float32 rows. int8 keeps one float32 scale per row; float16 needs none."""
+    if quantization == "float16":
+        return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+    if quantization == "int8":
+        scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12).astype(np.float32)
+        codes = np.clip(np.round(vectors / scales[:, None] * 127), -127, 127).astype(np.int8)
+        return codes, scales
+    raise ValueError(f"Unknown VECTOR_QUANTIZATION: {quantization}")
+
+
+def compressed_scores(codes: np.ndarray, scales: np.ndarray, query: np.ndarray, quantization: str) -> np.ndarray:
+    """Approximate dot products of a float32 query with quantized rows (the query itself stays full precision)."""
+    scores = codes.astype(np.float32) @ query
+    return scores * (scales / 127) if quantization == "int8" else scores
+
+
+def _json_path(key: str) -> str:
+    return '$."' + key.replace('"', '\\"') + '"'
+
+
+def where_to_sql(where: dict) -> tuple:
+    """Translates a Chroma-style `where` into an SQL condition over the JSON metadata column, plus its parameters."""
+    clauses, params = [], []
+    for key, condition in where.items():
+        if key in ("$and", "$or"):
+            parts = [where_to_sql(clause) for clause in condition]
+            joiner = " AND " if key == "$and" else " OR "
+            clauses.append("(" + joiner.join(sql for sql, _ in parts) + ")")
+            for _, part_params in parts:
+                params += part_params
+            continue
+        column = f"json_extract(metadata, '{_json_path(key)}')"
+        operators = condition if isinstance(condition, dict) else {"$eq": condition}
+        for op, value in operators.items():
+            if op == "$eq":
+                clauses.append(f"{column} = ?")
+                params.append(value)
+            elif op == "$ne":
+                clauses.append(f"({column} IS NULL OR {column} != ?)")
+                params.append(value)
+            elif op == "$in":
+                values = list(value)
+                clauses.append(f"{column} IN ({', '.join('?' for _ in values)})" if values else "0")
+                params += values
+            elif op in ("$gt", "$gte", "$lt", "$lte"):
+                clauses.append(f"{column} {dict(gt='>', gte='>=', lt='<', lte='<=')[op[1:]]} ?")
+                params.append(value)
+            else:
+                raise ValueError(f"Unsupported filter operator: {op}")
+    return " AND ".join(clauses) or "1", params
+
+
+class CompressedFlatIndex(VectorIndex):
+    """
+    Flat index for corpora that don't fit in RAM. Vectors live in three row-aligned files that are memory-mapped,
+    so only the pages a search touches are resident:
+      codes.<int8|float16>  quantized rows, scanned block by block for every query
+      scales.f32            per-row int8 scale
+      full.f32              unit-length float32 rows, read only for the top RESCORE_FACTOR * k candidates
+    Chunk text and metadata live in SQLite; `where` filters run there and only matching rows are scanned.
+    Deletes leave tombstones until compact() rewrites the files. Writes hold a file lock and the database row count
+    is authoritative for the files, so API workers sharing the directory stay aligned.
+    """
+
+    def __init__(self, directory: str = COMPRESSED_INDEX_DIR, quantization: str = VECTOR_QUANTIZATION):
+        if quantization not in QUANTIZED_DTYPES:
+            raise ValueError(f"Unknown VECTOR_QUANTIZATION: {quantization}")
+        self.directory = directory
+        self.quantization = quantization
+        self.code_dtype = QUANTIZED_DTYPES[quantization]
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(directory, "records.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS records (
+                position INTEGER PRIMARY KEY,
+                chunk_id TEXT UNIQUE NOT NULL,
+                document TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                deleted INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            """
+        )
+        self._conn.commit()
+        self._data_version = None
+        # Taking the write lock loads the state (rows, tombstones, memmaps) from the database
+        with self._write_lock():
+            # Rows past the committed count are leftovers of a write whose transaction failed
+            self._truncate_files()
+
+    # --- state shared with other processes ---
+    @contextmanager
+    def _write_lock(self):
+        """Serialises writers across threads and across API worker processes sharing the directory."""
+        _require_fcntl(type(self).__name__)
+        with self._lock, open(self._path("write.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_state(self) -> None:
+        settings = dict(self._conn.execute("SELECT key, value FROM settings").fetchall())
+        stored = settings.get("quantization")
+        if stored and stored != self.quantization:
+            raise ValueError(f"{self.directory} holds {stored} codes; rebuild it to switch to {self.quantization}")
+        self.dim = int(settings["dim"]) if "dim" in settings else None
+        self.rows = self._conn.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM records").fetchone()[0]
+        self._live = np.zeros(self.rows, dtype=bool)
+        live = [row[0] for row in self._conn.execute("SELECT position FROM records WHERE deleted = 0")]
+        self._live[live] = True
+        self._open_maps()
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _refresh(self) -> None:
+        """Reloads rows and tombstones if another process has committed since we last looked."""
+        if self._conn.execute("PRAGMA data_version").fetchone()[0] != self._data_version:
+            self._load_state()
+
+    # --- files ---
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @property
+    def _code_file(self) -> str:
+        return self._path(f"codes.{self.quantization}")
+
+    def _files(self) -> tuple:
+        """(path, bytes per row) of each vector file."""
+        dim = self.dim or 0
+        return (
+            (self._code_file, dim * np.dtype(self.code_dtype).itemsize),
+            (self._path("scales.f32"), 4),
+            (self._path("full.f32"), dim * 4),
+        )
+
+    def _truncate_files(self) -> None:
+        for path, row_bytes in self._files():
+            if os.path.exists(path) and os.path.getsize(path) != self.rows * row_bytes:
+                os.truncate(path, self.rows * row_bytes)
+
+    def _open_maps(self):
+        self._codes = self._scales = self._full = None
+        if self.rows and self.dim:
+            self._codes = np.memmap(self._code_file, dtype=self.code_dtype, mode="r", shape=(self.rows, self.dim))
+            self._scales = np.memmap(self._path("scales.f32"), dtype=np.float32, mode="r", shape=(self.rows,))
+            self._full = np.memmap(self._path("full.f32"), dtype=np.float32, mode="r", shape=(self.rows, self.dim))
+
+    def _write_rows(self, positions: list, vectors: np.ndarray) -> None:
+        """Overwrites existing rows in place (re-ingested chunks keep their position)."""
+        codes, scales = quantize(vectors, self.quantization)
+        for path, dtype, values, shape in (
+            (self._code_file, self.code_dtype, codes, (self.rows, self.dim)),
+            (self._path("scales.f32"), np.float32, scales, (self.rows,)),
+            (self._path("full.f32"), np.float32, vectors, (self.rows, self.dim)),
+        ):
+            target = np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+            target[positions] = values
+            target.flush()
+            del target
+
+    def _append_rows(self, vectors: np.ndarray) -> None:
+        """Writes new rows at position self.rows, i.e. at the end the database knows of, not the end of the file."""
+        codes, scales = quantize(vectors, self.quantization)
+        for (path, row_bytes), values in zip(self._files(), (codes, scales, vectors)):
+            with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+                f.seek(self.rows * row_bytes)
+                f.write(np.ascontiguousarray(values).tobytes())
+                f.truncate()
+
+    # --- VectorIndex ---
+    def upsert(self, ids, embeddings, documents, metadatas):
+        vectors = normalize_rows(embeddings)
+        # Last write wins if an id repeats within the batch
+        latest = {chunk_id: i for i, chunk_id in enumerate(ids)}
+        with self._write_lock(), self._conn:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                    [("dim", str(self.dim)), ("quantization", self.quantization)],
+                )
+            existing = self._positions(list(latest))
+            updates = [(existing[chunk_id], i) for chunk_id, i in latest.items() if chunk_id in existing]
+            new_rows = [i for chunk_id, i in latest.items() if chunk_id not in existing]
+
+            if updates:
+                self._write_rows([position for position, _ in updates], vectors[[i for _, i in updates]])
+                self._conn.executemany(
+                    "UPDATE records SET document = ?, metadata = ?, deleted = 0 WHERE position = ?",
+                    [(documents[i], json.dumps(metadatas[i] or {}), position) for position, i in updates],
+                )
+                self._live[[position for position, _ in updates]] = True
+            if new_rows:
+                self._append_rows(vectors[new_rows])
+                try:
+                    self._conn.executemany(
+                        "INSERT INTO records (position, chunk_id, document, metadata) VALUES (?, ?, ?, ?)",
+                        [
+                            (self.rows + offset, ids[i], documents[i], json.dumps(metadatas[i] or {}))
+                            for offset, i in enumerate(new_rows)
+                        ],
+                    )
+                except Exception:
+                    # The transaction rolls back, so the appended rows must go too
+                    self._truncate_files()
+                    raise
+                self.rows += len(new_rows)
+                self._live = np.concatenate([self._live, np.ones(len(new_rows), dtype=bool)])
+            self._open_maps()
+
+    def _positions(self, ids: list) -> dict:
+        positions = {}
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            rows = self._conn.execute(
+                f"SELECT chunk_id, position FROM records WHERE chunk_id IN ({', '.join('?' for _ in batch)})", batch
+            ).fetchall()
+            positions.update(rows)
+        return positions
+
+    def delete(self, ids):
+        if not ids:
+            return
+        with self._write_lock(), self._conn:
+            positions = list(self._positions(list(ids)).values())
+            self._conn.executemany(
+                "UPDATE records SET deleted = 1 WHERE position = ?", [(position,) for position in positions]
+            )
+            self._live[positions] = False
+
+    def get_embeddings(self, ids):
+        with self._lock:
+            self._refresh()
+            positions = self._positions(list(ids))
+            return {chunk_id: np.array(self._full[position]) for chunk_id, position in positions.items() if self._live[position]}
+
+    def _matching_positions(self, where: dict) -> np.ndarray:
+        if not where:
+            return np.flatnonzero(self._live)
+        condition, params = where_to_sql(where)
+        rows = self._conn.execute(
+            f"SELECT position FROM records WHERE deleted = 0 AND {condition} ORDER BY position", params
+        ).fetchall()
+        return np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+
+    def ids_where(self, where, ids=None):
+        with self._lock:
+            condition, params = where_to_sql(where) if where else ("1", [])
+            if ids is None:
+                rows = self._conn.execute(f"SELECT chunk_id FROM records WHERE deleted = 0 AND {condition}", params).fetchall()
+                return [row[0] for row in rows]
+            allowed = set()
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT chunk_id FROM records WHERE deleted = 0 AND {condition} "
+                    f"AND chunk_id IN ({', '.join('?' for _ in batch)})",
+                    params + batch,
+                ).fetchall()
+                allowed.update(row[0] for row in rows)
+            return [chunk_id for chunk_id in ids if chunk_id in allowed]
+
+    def _coarse_candidates(self, positions: np.ndarray, query: np.ndarray, depth: int) -> np.ndarray:
+        """Positions of the `depth` best rows by compressed score, scanning SCAN_BLOCK_ROWS rows at a time."""
+        best_positions, best_scores = [], []
+        for start in range(0, len(positions), SCAN_BLOCK_ROWS):
+            block = positions[start:start + SCAN_BLOCK_ROWS]
+            if block[-1] - block[0] + 1 == len(block):
+                # Contiguous rows (no filter, no tombstones here): a plain slice of the memmap
+                codes, scales = self._codes[block[0]:block[-1] + 1], self._scales[block[0]:block[-1] + 1]
+            else:
+                codes, scales = self._codes[block], self._scales[block]
+            scores = compressed_scores(codes, scales, query, self.quantization)
+            if scores.size > depth:
+                top = np.argpartition(-scores, depth - 1)[:depth]
+                block, scores = block[top], scores[top]
+            best_positions.append(block)
+            best_scores.append(scores)
+        positions, scores = np.concatenate(best_positions), np.concatenate(best_scores)
+        if scores.size > depth:
+            positions = positions[np.argpartition(-scores, depth - 1)[:depth]]
+        return np.sort(positions)
+
+    def search(self, embedding, k, where=None):
+        with self._lock:
+            self._refresh()
+            positions = self._matching_positions(where) if self._codes is not None else np.zeros(0, dtype=np.int64)
+            if positions.size == 0:
+                return []
+            query = normalize_rows(embedding)
+            candidates = self._coarse_candidates(positions, query, max(k * RESCORE_FACTOR, k))
+            # Rescore the shortlist at full precision; only these rows of full.f32 are paged in
+            exact = np.asarray(self._full[candidates]) @ query
+            order = np.argsort(-exact)[:k]
+            top = [int(candidates[i]) for i in order]
+            rows = dict(
+                (position, (document, metadata))
+                for position, document, metadata in self._conn.execute(
+                    f"SELECT position, document, metadata FROM records WHERE position IN ({', '.join('?' for _ in top)})", top
+                )
+            )
+        return [
+            (Document(page_content=rows[position][0], metadata=json.loads(rows[position][1])), float(exact[i]))
+            for position, i in zip(top, order)
+        ]
+
+    def page(self, offset, limit):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk_id, document, metadata FROM records WHERE deleted = 0 ORDER BY position LIMIT ? OFFSET ?",
+                (limit, offset),
+            ).fetchall()
+        return {
+            "ids": [row[0] for row in rows],
+            "documents": [row[1] for row in rows],
+            "metadatas": [json.loads(row[2]) for row in rows],
+        }
+
+    def count(self):
+        with self._lock:
+            self._refresh()
+            return int(self._live.sum())
+
+    def compact(self) -> int:
+        """Rewrites the vector files and records without tombstoned rows. Returns the number of rows dropped."""
+        with self._write_lock(), self._conn:
+            keep = np.flatnonzero(self._live)
+            dropped = self.rows - len(keep)
+            if dropped == 0:
+                return 0
+            for name, source in ((f"codes.{self.quantization}", self._codes), ("scales.f32", self._scales), ("full.f32", self._full)):
+                tmp_path = self._path(name + ".tmp")
+                with open(tmp_path, "wb") as f:
+                    for start in range(0, len(keep), SCAN_BLOCK_ROWS):
+                        f.write(np.ascontiguousarray(source[keep[start:start + SCAN_BLOCK_ROWS]]).tobytes())
+            self._codes = self._scales = self._full = None
+            for name in (f"codes.{self.quantization}", "scales.f32", "full.f32"):
+                os.replace(self._path(name + ".tmp"), self._path(name))
+            self._conn.execute("DELETE FROM records WHERE deleted = 1")
+            # Shift positions down to match the rewritten files (ascending order keeps the primary key unique)
+            self._conn.executemany(
+                "UPDATE records SET position = ? WHERE position = ?",
+                [(new, int(old)) for new, old in enumerate(keep) if new != old],
+            )
+            self.rows = len(keep)
+            self._live = np.ones(self.rows, dtype=bool)
+            self._open_maps()
+        with self._lock:
+            self._conn.execute("VACUUM")
+        return dropped
+
+    def memory_footprint(self) -> dict:
+        """Bytes scanned per query (codes + scales) versus what a float32 flat index keeps resident."""
+        rows, dim = self.rows, self.dim or 0
+        full = rows * dim * 4
+        compressed = rows * dim * np.dtype(self.code_dtype).itemsize + (rows * 4 if self.quantization == "int8" else 0)
+        return {
+            "quantization": self.quantization,
+            "rows": rows,
+            "live_rows": self.count(),
+            "dim": dim,
+            "float32_bytes": full,
+            "compressed_bytes": compressed,
+            "saved_bytes": full - compressed,
+            "compression_ratio": round(full / compressed, 2) if compressed else None,
+        }
+
+    def stats(self):
+        return {"backend": type(self).__name__, "count": self.count(), **self.memory_footprint()}
+
+
+def measure_compression(vectors, queries, k: int, quantization: str, rescore_factor: int = RESCORE_FACTOR) -> dict:
+    """
+    Recall@k of compressed search against exact float32 search over the same vectors, with and without the
+    full-precision rescoring step, plus the memory saved. Used to pick a quantization with real numbers.
+    """
+    vectors, queries = normalize_rows(vectors), normalize_rows(queries)
+    codes, scales = quantize(vectors, quantization)
+    depth = min(len(vectors), max(k * rescore_factor, k))
+    coarse_hits = rescored_hits = 0
+    for query in queries:
+        exact = set(np.argsort(-(vectors @ query))[:k].tolist())
+        approx = compressed_scores(codes, scales, query, quantization)
+        coarse_hits += len(exact & set(np.argsort(-approx)[:k].tolist()))
+        shortlist = np.argsort(-approx)[:depth]
+        rescored = shortlist[np.argsort(-(vectors[shortlist] @ query))[:k]]
+        rescored_hits += len(exact & set(rescored.tolist()))
+    total = max(len(queries) * min(k, len(vectors)), 1)
+    full_bytes = vectors.nbytes
+    compressed_bytes = codes.nbytes + (scales.nbytes if quantization == "int8" else 0)
+    return {
+        "quantization": quantization,
+        "vectors": len(vectors),
+        f"recall@{k}_compressed_only": round(coarse_hits / total, 4),
+        f"recall@{k}_with_rescoring": round(rescored_hits / total, 4),
+        "rescore_candidates": depth,
+        "float32_bytes": int(full_bytes),
+        "compressed_bytes": int(compressed_bytes),
+        "memory_saved_pct": round(100 * (1 - compressed_bytes / full_bytes), 2) if full_bytes else None,
+    }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_vector_index() -> VectorIndex:
+    """Process-wide index for the configured VECTOR_INDEX_BACKEND."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            if VECTOR_INDEX_BACKEND == "numpy":
+                _index = NumpyFlatIndex()
+            elif VECTOR_INDEX_BACKEND == "compressed":
+                _index = CompressedFlatIndex()
+            elif VECTOR_INDEX_BACKEND == "chroma":
+                _index = ChromaVectorIndex()
+            else:
+                raise ValueError(f"Unknown VECTOR_INDEX_BACKEND: {VECTOR_INDEX_BACKEND}")
+        return _index
@@ -1,45 +1,328 @@
 import os
+import time
+from html.parser import HTMLParser
+from langchain_core.documents import Document
 from langchain_community.document_loaders import PyMuPDFLoader, BSHTMLLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings.sentence_transformer import SentenceTransformerEmbeddings
 
-CHROMA_DB_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), ".chroma_data")
+from backend.core.lexical_index import get_lexical_index
+from backend.core.runtime import get_embedding_model, record_call, bump_index_version
+from backend.core.tracing import span
+from backend.core.vector_index import get_vector_index
+from backend.ingest.manifest import get_manifest, file_sha256, upload_hash, classify_chunks, finish_plan
 
-def get_embedding_model():
-    return SentenceTransformerEmbeddings(model_name="all-MiniLM-L6-v2")
+# Embedding is most efficient in large batches; Chroma writes are batched separately
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "1024"))
 
-def ingest_document(file_path: str, filename: str) -> dict:
-    try:
-        # Support both HTML and PDF
-        if filename.lower().endswith('.html'):
-            loader = BSHTMLLoader(file_path)
-        else:
-            loader = PyMuPDFLoader(file_path)
-        documents = loader.load()
-    except Exception as e:
-        return {"status": "error", "message": f"Failed to parse document: {str(e)}"}
+# Files at least this large are parsed page by page and embedded in rolling batches
+STREAMING_MIN_BYTES = int(os.getenv("STREAMING_INGEST_MIN_BYTES", str(32 * 1024 * 1024)))
+HTML_READ_BLOCK = 256 * 1024
+HTML_SEGMENT_CHARS = 64 * 1024
 
+def get_text_splitter():
     # Smart chunking
-    text_splitter = RecursiveCharacterTextSplitter(
+    return RecursiveCharacterTextSplitter(
         chunk_size=800,
         chunk_overlap=100,
         separators=["\n\n", "\n", "(?<=\. )", " ", ""]
     )
-    chunks = text_splitter.split_documents(documents)
 
+def upload_metadata(tags: list = None) -> dict:
+    """Filterable metadata stamped on every chunk of an upload: upload time plus one boolean key per tag."""
+    metadata = {"uploaded_at": time.time()}
+    for tag in tags or []:
+        metadata[f"tag:{tag.strip().lower()}"] = True
+    return metadata
+
+def load_and_split(file_path: str, filename: str, extra_metadata: dict = None) -> list:
+    """
+    Parses one file and returns its chunks as (text, metadata) pairs.
+    Kept free of the embedding model and plain-data in/out so it can run in a worker process.
+    """
+    # Support both HTML and PDF
+    if filename.lower().endswith('.html'):
+        loader = BSHTMLLoader(file_path)
+    else:
+        loader = PyMuPDFLoader(file_path)
+    documents = loader.load()
+
+    chunks = get_text_splitter().split_documents(documents)
+
+    split = []
     for i, chunk in enumerate(chunks):
+        chunk.metadata.update(extra_metadata or {})
         chunk.metadata["source"] = filename
         chunk.metadata["chunk_id"] = f"{filename}_chunk_{i:03d}"
+        split.append((chunk.page_content, chunk.metadata))
+    return split
+
+def should_stream(file_path: str) -> bool:
+    return os.getenv("INGEST_STREAMING") == "1" or os.path.getsize(file_path) >= STREAMING_MIN_BYTES
+
+class _HTMLTextStream(HTMLParser):
+    """Incremental HTML-to-text parser: fed in blocks, it buffers visible text only."""
+
+    SKIP_TAGS = {"script", "style", "noscript", "template"}
+    BLOCK_TAGS = {
+        "p", "div", "li", "tr", "table", "ul", "ol", "blockquote", "pre", "h1", "h2", "h3", "h4", "h5", "h6",
+        "section", "article", "header", "footer", "nav", "aside", "main",
+    }
+    CELL_TAGS = {"td", "th"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.size = 0
+        self._skip_depth = 0
+
+    def _separate(self, separator: str) -> None:
+        # Adjacent blocks and cells must not run their words together ("Revenue</td><td>2023")
+        if not self.parts or self.parts[-1].endswith("\n"):
+            return
+        if separator == " " and self.parts[-1].endswith(" "):
+            return
+        self.parts.append(separator)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag == "br":
+            # Void element: no end tag ever arrives
+            self.parts.append("\n")
+        elif tag in self.BLOCK_TAGS:
+            self._separate("\n\n")
+        elif tag in self.CELL_TAGS:
+            self._separate(" ")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag in self.BLOCK_TAGS:
+            self._separate("\n\n")
+        elif tag in self.CELL_TAGS:
+            self._separate(" ")
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        if data.strip():
+            self.parts.append(data)
+            self.size += len(data)
+        else:
+            # Whitespace between inline elements ("<b>net</b> <i>revenue</i>") still separates words
+            self._separate(" ")
+
+    def drain(self) -> str:
+        text = "".join(self.parts)
+        self.parts, self.size = [], 0
+        return text
+
+def _iter_html_segments(file_path: str):
+    """Yields the visible text of an HTML file in ~HTML_SEGMENT_CHARS pieces without loading the whole file."""
+    parser = _HTMLTextStream()
+    with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+        for block in iter(lambda: f.read(HTML_READ_BLOCK), ""):
+            parser.feed(block)
+            if parser.size >= HTML_SEGMENT_CHARS:
+                yield parser.drain()
+    parser.close()
+    tail = parser.drain()
+    if tail.strip():
+        yield tail
+
+def iter_chunks(file_path: str, filename: str, extra_metadata: dict = None):
+    """
+    Streaming counterpart of load_and_split: yields (text, metadata) chunks while reading the file,
+    one PDF page (or HTML text segment) at a time, with the same chunk_id numbering.
+    """
+    splitter = get_text_splitter()
+    if filename.lower().endswith('.html'):
+        pages = (Document(page_content=text, metadata={"source": filename}) for text in _iter_html_segments(file_path))
+    else:
+        pages = PyMuPDFLoader(file_path).lazy_load()
+
+    i = 0
+    for page in pages:
+        for chunk in splitter.split_documents([page]):
+            chunk.metadata.update(extra_metadata or {})
+            chunk.metadata["source"] = filename
+            chunk.metadata["chunk_id"] = f"{filename}_chunk_{i:03d}"
+            i += 1
+            yield chunk.page_content, chunk.metadata
+
+def embed_texts(texts: list) -> list:
+    """Embeds texts with the shared model in EMBED_BATCH_SIZE batches."""
+    embedding_function = get_embedding_model()
+    embeddings = []
+    for start in range(0, len(texts), EMBED_BATCH_SIZE):
+        with span("ingest.embed_batch"):
+            embeddings.extend(embedding_function.embed_documents(texts[start:start + EMBED_BATCH_SIZE]))
+    return embeddings
+
+def write_chunks(chunks: list, embeddings: list) -> None:
+    """Upserts pre-embedded (text, metadata) chunks into the vector index in WRITE_BATCH_SIZE batches, keyed by chunk_id."""
+    vector_index = get_vector_index()
+    for start in range(0, len(chunks), WRITE_BATCH_SIZE):
+        batch = chunks[start:start + WRITE_BATCH_SIZE]
+        with span("ingest.write_batch"):
+            vector_index.upsert(
+                ids=[metadata["chunk_id"] for _, metadata in batch],
+                documents=[text for text, _ in batch],
+                metadatas=[metadata for _, metadata in batch],
+                embeddings=embeddings[start:start + WRITE_BATCH_SIZE],
+            )
+            # Keep the BM25 index in lockstep with the vector index
+            get_lexical_index().upsert([(metadata["chunk_id"], metadata["source"], text) for text, metadata in batch])
+    if chunks:
+        bump_index_version()
+
+def apply_plan(filename: str, plan: dict) -> int:
+    """
+    Applies the parts of a manifest plan that need no embedding: copies stored vectors to chunks
+    whose content merely moved, and deletes chunks that no longer exist. Returns the number reused.
+    Anything whose stored vector has gone missing is moved to plan["embed"].
+    """
+    reused = reuse_vectors(plan)
+    delete_stale(filename, plan)
+    return reused
+
+def reuse_vectors(plan: dict) -> int:
+    """
+    Writes the chunks whose content already has a stored vector: moved chunks (plan["reuse"]) and unchanged
+    ones re-stamped with this upload's metadata (plan["restamp"]). Returns the number of moved chunks reused.
+    """
+    pairs = plan["reuse"] + [(chunk, chunk[1]["chunk_id"]) for chunk in plan["restamp"]]
+    writes, moved = [], 0
+    if pairs:
+        # Fetch every vector before writing any, since a reused id may itself be overwritten below
+        by_id = get_vector_index().get_embeddings([old_id for _, old_id in pairs])
+        for i, (chunk, old_id) in enumerate(pairs):
+            if old_id in by_id:
+                writes.append((chunk, by_id[old_id]))
+                moved += i < len(plan["reuse"])
+            else:
+                plan["embed"].append(chunk)
+        if writes:
+            write_chunks([chunk for chunk, _ in writes], [embedding for _, embedding in writes])
+    return moved
+
+def delete_stale(filename: str, plan: dict) -> None:
+    vector_index = get_vector_index()
+    stale = list(plan["delete"])
+    if not plan["known"]:
+        # Files indexed before the manifest existed were stored under random ids; clear them by source
+        existing = vector_index.ids_where({"source": filename})
+        stale += [chunk_id for chunk_id in existing if chunk_id not in plan["chunk_hashes"]]
+    if stale:
+        vector_index.delete(stale)
+        get_lexical_index().delete(stale)
+        bump_index_version()
+
+def index_chunks(chunks: list) -> int:
+    if not chunks:
+        return 0
+    embeddings = embed_texts([text for text, _ in chunks])
+    write_chunks(chunks, embeddings)
+    return len(chunks)
+
+def stream_index_document(file_path: str, filename: str, file_hash: str, on_indexed=None, extra_metadata: dict = None) -> dict:
+    """
+    Parses, embeds and writes a document in rolling EMBED_BATCH_SIZE batches so peak memory
+    is bounded by one page plus one batch, regardless of document size. `on_indexed(n)` reports newly embedded chunks.
+    """
+    manifest = get_manifest()
+    plan = manifest.start_plan(filename)
+    written = set()
+    totals = {"chunks_total": 0, "chunks_embedded": 0, "chunks_reused": 0}
+
+    def flush(batch):
+        classify_chunks(plan, batch, written)
+        reused = reuse_vectors(plan)
+        embedded = index_chunks(plan["embed"])
+        written.update(metadata["chunk_id"] for _, metadata in plan["embed"])
+        written.update(metadata["chunk_id"] for (_, metadata), _ in plan["reuse"])
+        # Only hashes are kept across batches; the chunk text is released here
+        plan["embed"], plan["reuse"], plan["restamp"] = [], [], []
+        totals["chunks_embedded"] += embedded
+        totals["chunks_reused"] += reused
+        if on_indexed:
+            on_indexed(embedded)
+
+    batch = []
+    for chunk in iter_chunks(file_path, filename, extra_metadata):
+        batch.append(chunk)
+        totals["chunks_total"] += 1
+        if len(batch) >= EMBED_BATCH_SIZE:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+    finish_plan(plan)
+    delete_stale(filename, plan)
+    manifest.commit(filename, file_hash, plan["chunk_hashes"])
+    return {
+        **totals,
+        "chunks_unchanged": plan["unchanged"],
+        "chunks_deleted": len(plan["delete"]),
+    }
+
+def ingest_document(file_path: str, filename: str, streaming: bool = None, tags: list = None) -> dict:
+    """Indexes one file. `streaming` defaults to on for files of at least STREAMING_INGEST_MIN_BYTES."""
+    start = time.perf_counter()
+    try:
+        if streaming is None:
+            streaming = should_stream(file_path)
+        if streaming:
+            return _stream_ingest_document(file_path, filename, upload_metadata(tags))
+        return _ingest_document(file_path, filename, upload_metadata(tags))
+    finally:
+        record_call("ingest_document", time.perf_counter() - start)
+
+def _stream_ingest_document(file_path: str, filename: str, extra_metadata: dict) -> dict:
+    manifest = get_manifest()
+    try:
+        file_hash = upload_hash(file_sha256(file_path), extra_metadata)
+        if manifest.file_hash(filename) == file_hash:
+            return {"status": "success", "chunks_indexed": 0, "unchanged": True, "filename": filename}
+        totals = stream_index_document(file_path, filename, file_hash, extra_metadata=extra_metadata)
+    except Exception as e:
+        return {"status": "error", "message": f"Failed to stream-index document: {str(e)}"}
+
+    return {
+        "status": "success",
+        "chunks_indexed": totals["chunks_embedded"] + totals["chunks_reused"],
+        **totals,
+        "filename": filename,
+        "streamed": True,
+    }
+
+def _ingest_document(file_path: str, filename: str, extra_metadata: dict) -> dict:
+    manifest = get_manifest()
+    try:
+        file_hash = upload_hash(file_sha256(file_path), extra_metadata)
+        if manifest.file_hash(filename) == file_hash:
+            # Byte-identical re-upload: nothing to parse, embed or write
+            return {"status": "success", "chunks_indexed": 0, "unchanged": True, "filename": filename}
+        chunks = load_and_split(file_path, filename, extra_metadata)
+    except Exception as e:
+        return {"status": "error", "message": f"Failed to parse document: {str(e)}"}
 
     try:
-        embedding_function = get_embedding_model()
-        vectorstore = Chroma.from_documents(
-            documents=chunks,
-            embedding=embedding_function,
-            persist_directory=CHROMA_DB_DIR
-        )
+        plan = manifest.plan(filename, chunks)
+        reused = apply_plan(filename, plan)
+        embedded = index_chunks(plan["embed"])
+        manifest.commit(filename, file_hash, plan["chunk_hashes"])
     except Exception as e:
         return {"status": "error", "message": f"Failed to index: {str(e)}"}
 
-    return {"status": "success", "chunks_indexed": len(chunks), "filename": filename}
\ No newline at end of file
+    return {
+        "status": "success",
+        "chunks_indexed": embedded + reused,
+        "chunks_embedded": embedded,
+        "chunks_reused": reused,
+        "chunks_unchanged": plan["unchanged"],
+        "chunks_deleted": len(plan["delete"]),
+        "filename": filename,
+    }
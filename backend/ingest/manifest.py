@@ -0,0 +1,162 @@
+# backend/ingest/manifest.py
+# Content-hash manifest of everything in the vector store, so re-ingestion only touches what changed.
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from backend.core.runtime import CHROMA_DB_DIR
+
+MANIFEST_PATH = os.path.join(CHROMA_DB_DIR, "ingest_manifest.sqlite3")
+
+
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def upload_hash(file_hash: str, metadata: dict) -> str:
+    """
+    The file hash recorded for an upload: its content hash, plus its tags when it has any, so a byte-identical
+    re-upload with different tags is re-applied rather than skipped as unchanged.
+    """
+    tags = sorted(key for key in metadata or {} if key.startswith("tag:"))
+    if not tags:
+        return file_hash
+    return f"{file_hash}+{hashlib.sha256(','.join(tags).encode('utf-8')).hexdigest()[:16]}"
+
+
+class DocumentManifest:
+    """
+    SQLite-backed record of each indexed file's hash and the hash of every chunk stored under it.
+    Row-level updates keep a nightly re-sync of thousands of files from rewriting one big manifest per file.
+    """
+
+    def __init__(self, path: str = MANIFEST_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                filename TEXT PRIMARY KEY,
+                file_hash TEXT NOT NULL,
+                chunk_count INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                chunk_hash TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS chunks_by_file ON chunks (filename);
+            """
+        )
+        self._conn.commit()
+
+    def file_hash(self, filename: str):
+        with self._lock:
+            row = self._conn.execute("SELECT file_hash FROM files WHERE filename = ?", (filename,)).fetchone()
+        return row[0] if row else None
+
+    def chunk_hashes(self, filename: str) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT chunk_id, chunk_hash FROM chunks WHERE filename = ?", (filename,)).fetchall()
+        return dict(rows)
+
+    def plan(self, filename: str, chunks: list) -> dict:
+        """
+        Compares freshly split (text, metadata) chunks with what is stored for `filename`:
+          embed     - chunks whose content is new and needs an embedding
+          reuse     - (chunk, stored_chunk_id) pairs whose content already has an embedding under another id
+          restamp   - chunks stored with identical content under the same id, rewritten with this upload's
+                      metadata (tags, uploaded_at) on their stored vector
+          delete    - stored chunk ids that no longer exist
+          unchanged - number of chunks stored with identical content under the same id
+        """
+        plan = self.start_plan(filename)
+        classify_chunks(plan, chunks)
+        return finish_plan(plan)
+
+    def start_plan(self, filename: str) -> dict:
+        """Empty plan for `filename`; feed it with classify_chunks (all at once or in batches), then finish_plan."""
+        known = self.chunk_hashes(filename)
+        by_hash = {}
+        for chunk_id, digest in known.items():
+            by_hash.setdefault(digest, chunk_id)
+        return {
+            "embed": [], "reuse": [], "restamp": [], "delete": [], "unchanged": 0, "chunk_hashes": {},
+            "known": bool(known), "_known": known, "_by_hash": by_hash,
+        }
+
+    def commit(self, filename: str, file_hash: str, chunk_hashes: dict) -> None:
+        """Records `filename` as fully indexed with the given file and chunk hashes."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM chunks WHERE filename = ?", (filename,))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (chunk_id, filename, chunk_hash) VALUES (?, ?, ?)",
+                [(chunk_id, filename, digest) for chunk_id, digest in chunk_hashes.items()],
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (filename, file_hash, chunk_count, updated_at) VALUES (?, ?, ?, ?)",
+                (filename, file_hash, len(chunk_hashes), time.time()),
+            )
+
+    def remove(self, filename: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM chunks WHERE filename = ?", (filename,))
+            self._conn.execute("DELETE FROM files WHERE filename = ?", (filename,))
+
+    def files(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT filename, file_hash, chunk_count, updated_at FROM files").fetchall()
+        return {row[0]: {"file_hash": row[1], "chunk_count": row[2], "updated_at": row[3]} for row in rows}
+
+
+def classify_chunks(plan: dict, chunks: list, written: set = None) -> None:
+    """
+    Sorts `chunks` into the plan's embed/reuse lists and tags each chunk's metadata with its hash.
+    `written` holds ids already overwritten earlier in a streamed run; their old vectors can no longer be reused.
+    """
+    known, by_hash = plan["_known"], plan["_by_hash"]
+    for text, metadata in chunks:
+        chunk_id = metadata["chunk_id"]
+        digest = chunk_sha256(text)
+        metadata["chunk_hash"] = digest
+        plan["chunk_hashes"][chunk_id] = digest
+        source_id = by_hash.get(digest)
+        if known.get(chunk_id) == digest:
+            plan["unchanged"] += 1
+            plan["restamp"].append((text, metadata))
+        elif source_id is not None and not (written and source_id in written):
+            plan["reuse"].append(((text, metadata), source_id))
+        else:
+            plan["embed"].append((text, metadata))
+
+
+def finish_plan(plan: dict) -> dict:
+    plan["delete"] = [chunk_id for chunk_id in plan["_known"] if chunk_id not in plan["chunk_hashes"]]
+    return plan
+
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+
+def get_manifest() -> DocumentManifest:
+    global _manifest
+    with _manifest_lock:
+        if _manifest is None:
+            _manifest = DocumentManifest()
+        return _manifest
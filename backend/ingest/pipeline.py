@@ -0,0 +1,294 @@
+# backend/ingest/pipeline.py
+# Background ingestion jobs: parallel parsing, cross-file embedding batches and batched vector-store writes.
+
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from backend.ingest.document_parser import (
+    load_and_split, embed_texts, write_chunks, apply_plan, should_stream, stream_index_document, upload_metadata,
+    EMBED_BATCH_SIZE, WRITE_BATCH_SIZE,
+)
+from backend.ingest.manifest import get_manifest, file_sha256, upload_hash
+
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 1)))
+MAX_ACTIVE_JOBS = int(os.getenv("INGEST_MAX_JOBS", "2"))
+MAX_RETAINED_JOBS = 200
+
+_job_executor = ThreadPoolExecutor(max_workers=MAX_ACTIVE_JOBS, thread_name_prefix="ingest-job")
+# A single writer keeps Chroma writes ordered and lets the next batch embed while the previous one is written
+_write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-writer")
+_parse_pool = None
+_pool_lock = threading.Lock()
+
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+
+
+def _get_parse_pool():
+    """Process pool for parsing/chunking. Uses spawn so workers never inherit the loaded torch model."""
+    global _parse_pool
+    with _pool_lock:
+        if _parse_pool is None:
+            if PARSE_WORKERS <= 1:
+                _parse_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-parse")
+            else:
+                _parse_pool = ProcessPoolExecutor(
+                    max_workers=PARSE_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+        return _parse_pool
+
+
+class IngestionJob:
+    """Progress of one multi-file upload, safe to read from request handlers while the pipeline updates it."""
+
+    def __init__(self, files: list, cleanup: bool = True, tags: list = None):
+        self.id = uuid.uuid4().hex
+        self.metadata = upload_metadata(tags)
+        self.status = "queued"
+        self.cleanup = cleanup
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.paths = [path for path, _ in files]
+        self.files = [
+            {
+                "filename": filename, "status": "queued", "chunks_total": None, "chunks_unchanged": 0,
+                "chunks_reused": 0, "chunks_to_embed": None, "chunks_indexed": 0, "error": None,
+            }
+            for _, filename in files
+        ]
+        # Manifest entries are committed only once every chunk of the file is written
+        self.pending_commits = {}
+        self._lock = threading.Lock()
+
+    def update_file(self, index: int, **fields) -> None:
+        with self._lock:
+            self.files[index].update(fields)
+
+    def add_indexed(self, counts: dict) -> list:
+        """Adds written-chunk counts and returns the indexes of files that just finished."""
+        finished = []
+        with self._lock:
+            for index, count in counts.items():
+                entry = self.files[index]
+                entry["chunks_indexed"] += count
+                if entry["chunks_to_embed"] is not None and entry["chunks_indexed"] >= entry["chunks_to_embed"]:
+                    entry["status"] = "indexed"
+                    finished.append(index)
+        return finished
+
+    def commit_file(self, index: int) -> None:
+        pending = self.pending_commits.pop(index, None)
+        if pending is not None:
+            get_manifest().commit(self.files[index]["filename"], *pending)
+
+    def fail_files(self, indexes, error: str) -> None:
+        with self._lock:
+            for index in indexes:
+                self.files[index].update(status="error", error=error)
+
+    def final_status(self) -> str:
+        """completed, completed_with_errors when some files failed, or failed when none was ingested."""
+        with self._lock:
+            failed = sum(1 for entry in self.files if entry["status"] == "error")
+        if not failed:
+            return "completed"
+        return "failed" if failed == len(self.files) else "completed_with_errors"
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            files = [dict(entry) for entry in self.files]
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        chunks_indexed = sum(entry["chunks_indexed"] for entry in files)
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "files_total": len(files),
+            "files_done": sum(1 for entry in files if entry["status"] in ("indexed", "unchanged", "duplicate", "error")),
+            "files_unchanged": sum(1 for entry in files if entry["status"] == "unchanged"),
+            "files_failed": sum(1 for entry in files if entry["status"] == "error"),
+            "chunks_indexed": chunks_indexed,
+            "elapsed_s": round(elapsed, 3),
+            "chunks_per_s": round(chunks_indexed / elapsed, 2) if elapsed > 0 else 0.0,
+            "files": files,
+        }
+
+
+def _submit_write(job: IngestionJob, batch: list, previous):
+    """Waits for the in-flight write, then hands `batch` of (file index, chunk, embedding) to the writer."""
+    if previous is not None:
+        previous.result()
+
+    def write():
+        try:
+            write_chunks([chunk for _, chunk, _ in batch], [embedding for _, _, embedding in batch])
+        except Exception as e:
+            job.fail_files({index for index, _, _ in batch}, f"Failed to index: {str(e)}")
+            return
+        counts = {}
+        for index, _, _ in batch:
+            counts[index] = counts.get(index, 0) + 1
+        for index in job.add_indexed(counts):
+            job.commit_file(index)
+
+    return _write_executor.submit(write)
+
+
+def _run_streamed_file(job: IngestionJob, index: int, file_hash: str) -> None:
+    job.update_file(index, status="streaming")
+    try:
+        totals = stream_index_document(
+            job.paths[index], job.files[index]["filename"], file_hash,
+            on_indexed=lambda count: job.add_indexed({index: count}),
+            extra_metadata=job.metadata,
+        )
+        job.update_file(
+            index,
+            status="indexed",
+            chunks_total=totals["chunks_total"],
+            chunks_unchanged=totals["chunks_unchanged"],
+            chunks_reused=totals["chunks_reused"],
+            chunks_to_embed=totals["chunks_embedded"],
+        )
+    except Exception as e:
+        job.update_file(index, status="error", error=f"Failed to stream-index document: {str(e)}")
+    finally:
+        if job.cleanup and os.path.exists(job.paths[index]):
+            os.remove(job.paths[index])
+
+
+def _run_job(job: IngestionJob) -> None:
+    job.status = "running"
+    job.started_at = time.time()
+    try:
+        pool = _get_parse_pool()
+        manifest = get_manifest()
+        futures = {}
+        file_hashes = {}
+        streamed = []
+        # The same name twice in one upload would plan both copies against the same manifest entry; the last one wins
+        last_upload = {entry["filename"]: index for index, entry in enumerate(job.files)}
+        for index, (path, entry) in enumerate(zip(job.paths, job.files)):
+            if last_upload[entry["filename"]] != index:
+                job.update_file(index, status="duplicate", error="Superseded by a later file with the same name in this upload")
+                if job.cleanup and os.path.exists(path):
+                    os.remove(path)
+                continue
+            try:
+                file_hashes[index] = upload_hash(file_sha256(path), job.metadata)
+            except Exception as e:
+                job.update_file(index, status="error", error=f"Failed to read document: {str(e)}")
+                continue
+            if manifest.file_hash(entry["filename"]) == file_hashes[index]:
+                # Byte-identical to what is indexed, with the same tags: skip parsing and embedding entirely
+                job.update_file(index, status="unchanged")
+                if job.cleanup:
+                    os.remove(path)
+                continue
+            if should_stream(path):
+                # Large files bypass the pool: they are parsed and embedded page by page below
+                streamed.append(index)
+                continue
+            futures[pool.submit(load_and_split, path, entry["filename"], job.metadata)] = index
+            job.update_file(index, status="parsing")
+
+        to_embed = []
+        to_write = []
+        in_flight = None
+
+        def embed_pending(flush: bool):
+            nonlocal to_embed, to_write, in_flight
+            while len(to_embed) >= EMBED_BATCH_SIZE or (flush and to_embed):
+                batch, to_embed = to_embed[:EMBED_BATCH_SIZE], to_embed[EMBED_BATCH_SIZE:]
+                embeddings = embed_texts([chunk[0] for _, chunk in batch])
+                to_write.extend((index, chunk, embedding) for (index, chunk), embedding in zip(batch, embeddings))
+            while len(to_write) >= WRITE_BATCH_SIZE or (flush and to_write):
+                batch, to_write = to_write[:WRITE_BATCH_SIZE], to_write[WRITE_BATCH_SIZE:]
+                in_flight = _submit_write(job, batch, in_flight)
+
+        # Files are embedded in completion order, so fast files never wait behind a large one
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                chunks = future.result()
+            except Exception as e:
+                job.update_file(index, status="error", error=f"Failed to parse document: {str(e)}")
+                continue
+            finally:
+                if job.cleanup and os.path.exists(job.paths[index]):
+                    os.remove(job.paths[index])
+
+            filename = job.files[index]["filename"]
+            try:
+                plan = manifest.plan(filename, chunks)
+                reused = apply_plan(filename, plan)
+            except Exception as e:
+                job.update_file(index, status="error", error=f"Failed to index: {str(e)}")
+                continue
+
+            job.pending_commits[index] = (file_hashes[index], plan["chunk_hashes"])
+            job.update_file(
+                index,
+                status="embedding" if plan["embed"] else "indexed",
+                chunks_total=len(chunks),
+                chunks_unchanged=plan["unchanged"],
+                chunks_reused=reused,
+                chunks_to_embed=len(plan["embed"]),
+            )
+            if not plan["embed"]:
+                job.commit_file(index)
+            to_embed.extend((index, chunk) for chunk in plan["embed"])
+            embed_pending(flush=False)
+
+        embed_pending(flush=True)
+        if in_flight is not None:
+            in_flight.result()
+
+        for index in streamed:
+            _run_streamed_file(job, index, file_hashes[index])
+        job.status = job.final_status()
+    except Exception as e:
+        job.status = "failed"
+        job.fail_files(
+            [i for i, entry in enumerate(job.files) if entry["status"] not in ("indexed", "unchanged", "duplicate", "error")],
+            str(e),
+        )
+    finally:
+        job.finished_at = time.time()
+        if job.cleanup:
+            # Drop the per-upload staging directories once they are empty
+            for directory in {os.path.dirname(path) for path in job.paths}:
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    pass
+
+
+def submit_job(files: list, cleanup: bool = True, tags: list = None) -> IngestionJob:
+    """Queues (path, filename) pairs for background ingestion and returns the job immediately."""
+    job = IngestionJob(files, cleanup=cleanup, tags=tags)
+    with _jobs_lock:
+        _jobs[job.id] = job
+        while len(_jobs) > MAX_RETAINED_JOBS:
+            _jobs.popitem(last=False)
+    _job_executor.submit(_run_job, job)
+    return job
+
+
+def run_job(files: list, cleanup: bool = False, tags: list = None) -> dict:
+    """Runs an ingestion job in the calling thread (used by scripts) and returns its final report."""
+    job = IngestionJob(files, cleanup=cleanup, tags=tags)
+    _run_job(job)
+    return job.to_dict()
+
+
+def get_job(job_id: str):
+    with _jobs_lock:
+        return _jobs.get(job_id)
@@ -0,0 +1,188 @@
+# backend/ingest/snapshot.py
+# Portable snapshots of the indexed corpus (vectors, chunks, manifest) and offline compaction of the stores.
+
+import json
+import os
+import time
+
+import numpy as np
+
+from backend.core.lexical_index import get_lexical_index, sync_with_vector_index
+from backend.core.runtime import EMBEDDING_MODEL_NAME, bump_index_version
+from backend.core.vector_index import get_vector_index
+from backend.ingest.document_parser import write_chunks, WRITE_BATCH_SIZE
+from backend.ingest.manifest import get_manifest, chunk_sha256
+
+SNAPSHOT_FORMAT = 1
+PAGE_SIZE = 5000
+
+# Snapshot directory layout: rows of embeddings.f32 line up with the lines of chunks.jsonl
+META_FILE = "snapshot.json"
+CHUNKS_FILE = "chunks.jsonl"
+EMBEDDINGS_FILE = "embeddings.f32"
+MANIFEST_FILE = "manifest.json"
+
+
+def _iter_pages(vector_index, page_size: int = PAGE_SIZE):
+    for offset in range(0, vector_index.count(), page_size):
+        page = vector_index.page(offset, page_size)
+        if not page["ids"]:
+            break
+        yield page
+
+
+def export_snapshot(out_dir: str) -> dict:
+    """
+    Writes every stored chunk with its embedding, plus the manifest, to `out_dir`.
+    Pages through the index, so memory stays bounded by one page whatever the corpus size.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    vector_index = get_vector_index()
+    manifest = get_manifest()
+    start = time.perf_counter()
+    count, dim = 0, None
+    with open(os.path.join(out_dir, CHUNKS_FILE), "w", encoding="utf-8") as chunks_out, \
+            open(os.path.join(out_dir, EMBEDDINGS_FILE), "wb") as vectors_out:
+        for page in _iter_pages(vector_index):
+            by_id = vector_index.get_embeddings(page["ids"])
+            rows = [
+                (chunk_id, text, metadata) for chunk_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"])
+                if chunk_id in by_id
+            ]
+            if not rows:
+                continue
+            vectors = np.asarray([by_id[chunk_id] for chunk_id, _, _ in rows], dtype=np.float32)
+            dim = vectors.shape[1]
+            vectors_out.write(np.ascontiguousarray(vectors).tobytes())
+            for chunk_id, text, metadata in rows:
+                chunks_out.write(json.dumps({"id": chunk_id, "document": text, "metadata": metadata or {}}) + "\n")
+            count += len(rows)
+
+    files = {
+        filename: {"file_hash": entry["file_hash"], "chunks": manifest.chunk_hashes(filename)}
+        for filename, entry in manifest.files().items()
+    }
+    with open(os.path.join(out_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(files, f)
+
+    meta = {
+        "format": SNAPSHOT_FORMAT,
+        "embedding_model": EMBEDDING_MODEL_NAME,
+        "dim": dim,
+        "chunks": count,
+        "files": len(files),
+        "created_at": time.time(),
+        "source_backend": type(vector_index).__name__,
+    }
+    with open(os.path.join(out_dir, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return {**meta, "path": out_dir, "elapsed_s": round(time.perf_counter() - start, 3)}
+
+
+def import_snapshot(snapshot_dir: str) -> dict:
+    """
+    Loads a snapshot into the configured index without re-embedding anything.
+    Files in the snapshot replace what is stored under the same name; other files are left alone.
+    """
+    with open(os.path.join(snapshot_dir, META_FILE), encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"Unsupported snapshot format: {meta.get('format')}")
+    if meta.get("embedding_model") != EMBEDDING_MODEL_NAME:
+        # Vectors from another model would be silently meaningless against this server's query embeddings
+        raise ValueError(f"Snapshot was embedded with {meta.get('embedding_model')}, this server uses {EMBEDDING_MODEL_NAME}")
+    with open(os.path.join(snapshot_dir, MANIFEST_FILE), encoding="utf-8") as f:
+        files = json.load(f)
+
+    start = time.perf_counter()
+    vector_index = get_vector_index()
+    manifest = get_manifest()
+
+    # Drop chunks of replaced files that the snapshot no longer has
+    stale = []
+    for filename, entry in files.items():
+        stale += [chunk_id for chunk_id in manifest.chunk_hashes(filename) if chunk_id not in entry["chunks"]]
+    if stale:
+        vector_index.delete(stale)
+        get_lexical_index().delete(stale)
+
+    imported = 0
+    if meta["chunks"]:
+        vectors = np.memmap(os.path.join(snapshot_dir, EMBEDDINGS_FILE), dtype=np.float32, mode="r", shape=(meta["chunks"], meta["dim"]))
+        batch = []
+        with open(os.path.join(snapshot_dir, CHUNKS_FILE), encoding="utf-8") as chunks_in:
+            for line in chunks_in:
+                record = json.loads(line)
+                # write_chunks keys vectors and BM25 entries on metadata["chunk_id"]
+                metadata = {**record["metadata"], "chunk_id": record["id"]}
+                metadata.setdefault("source", "Unknown_File")
+                batch.append((record["document"], metadata))
+                if len(batch) >= WRITE_BATCH_SIZE:
+                    write_chunks(batch, vectors[imported:imported + len(batch)].tolist())
+                    imported += len(batch)
+                    batch = []
+        if batch:
+            write_chunks(batch, vectors[imported:imported + len(batch)].tolist())
+            imported += len(batch)
+
+    # Manifest last, so an interrupted import is re-done rather than mistaken for indexed files
+    for filename, entry in files.items():
+        manifest.commit(filename, entry["file_hash"], entry["chunks"])
+    bump_index_version()
+    return {
+        "chunks_imported": imported,
+        "files_imported": len(files),
+        "chunks_deleted": len(stale),
+        "elapsed_s": round(time.perf_counter() - start, 3),
+    }
+
+
+def compact_store(drop_unmanaged: bool = False) -> dict:
+    """
+    Removes chunks the manifest does not account for and brings the manifest and keyword index back in line:
+      duplicates - unlisted chunks whose text is already stored under a listed id of the same file
+      orphans    - other unlisted chunks of manifest files (e.g. left by an interrupted re-index), and, with
+                   `drop_unmanaged`, chunks of files missing from the manifest entirely (indexed before it existed)
+      incomplete - manifest files with listed chunks missing from the index; forgotten so the next ingest re-embeds them
+    The compressed backend also reclaims the space of deleted rows.
+    """
+    start = time.perf_counter()
+    vector_index = get_vector_index()
+    manifest = get_manifest()
+    listed = {filename: manifest.chunk_hashes(filename) for filename in manifest.files()}
+    listed_hashes = {filename: set(chunks.values()) for filename, chunks in listed.items()}
+
+    duplicates, orphans, present = [], [], set()
+    for page in _iter_pages(vector_index):
+        for chunk_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+            source = (metadata or {}).get("source")
+            if source in listed and chunk_id in listed[source]:
+                present.add(chunk_id)
+            elif source in listed and chunk_sha256(text or "") in listed_hashes[source]:
+                duplicates.append(chunk_id)
+            elif source in listed or drop_unmanaged:
+                orphans.append(chunk_id)
+    removed = duplicates + orphans
+    # Delete in pages so a large cleanup doesn't become one oversized write
+    for offset in range(0, len(removed), WRITE_BATCH_SIZE):
+        vector_index.delete(removed[offset:offset + WRITE_BATCH_SIZE])
+        get_lexical_index().delete(removed[offset:offset + WRITE_BATCH_SIZE])
+
+    incomplete = [filename for filename, chunks in listed.items() if any(chunk_id not in present for chunk_id in chunks)]
+    for filename in incomplete:
+        manifest.remove(filename)
+
+    # Rebuilds the keyword index if it still disagrees with the vectors (e.g. entries the vector index never had)
+    lexical_rebuilt = sync_with_vector_index(vector_index)
+    rows_reclaimed = vector_index.compact() if hasattr(vector_index, "compact") else 0
+    if removed or incomplete or lexical_rebuilt:
+        bump_index_version()
+    return {
+        "duplicates_removed": len(duplicates),
+        "orphans_removed": len(orphans),
+        "files_forgotten": incomplete,
+        "lexical_rebuilt": lexical_rebuilt,
+        "rows_reclaimed": rows_reclaimed,
+        "chunks_remaining": vector_index.count(),
+        "elapsed_s": round(time.perf_counter() - start, 3),
+    }
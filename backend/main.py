@@ -2,17 +2,57 @@
 
 import os
 import shutil
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import uuid
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, Field
+from typing import List, Optional
 
 # Import our working intelligence layer!
-from backend.ingest.document_parser import ingest_document
-from backend.core.graph import agent_executor
+from backend.ingest.pipeline import submit_job, get_job
+from backend.core.graph import agent_executor, llm
+from backend.core.conversations import (
+    DEFAULT_USER_ID, CONVERSATION_MAX_MESSAGES, get_conversation_store, get_session, drop_session,
+    activate_session, build_messages, schedule_compaction, wait_for_compaction,
+)
+from backend.core.runtime import warm_up, runtime_status
+from backend.core.lexical_index import sync_with_vector_index
+from backend.core.vector_index import get_vector_index
+from backend.core.sandbox_pool import get_sandbox_pool
+from backend.core.reranker import RERANK_ENABLED, get_cross_encoder
+from backend.core.answer_cache import ANSWER_CACHE_ENABLED, get_answer_cache
+from backend.core.concurrency import INGEST_EXECUTOR, run_blocking, chat_limiter, ingest_limiter
+from backend.core.streaming import stream_agent_events, format_sse, extract_citations
+from backend.core.tracing import METRICS, TracingCallbackHandler, start_trace, current_trace, maybe_profile
+from backend.tools.rag_tool import retrieval_cache_stats, embed_query
+from backend.tools.memory_tool import memory_snapshot, memory_signature
+import time
 import traceback
 
-app = FastAPI(title="Agentic RAG API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the embedding model and open Chroma once, before the first request arrives
+    try:
+        await run_in_threadpool(warm_up)
+        # Backfill the BM25 index for chunks indexed before it existed
+        await run_in_threadpool(lambda: sync_with_vector_index(get_vector_index()))
+        # Drop chat sessions that expired while the server was down
+        await run_in_threadpool(get_conversation_store().prune)
+        # Start the sandbox workers now so the first execute_python call doesn't pay for the pandas import
+        await run_in_threadpool(get_sandbox_pool().start)
+        if RERANK_ENABLED:
+            await run_in_threadpool(get_cross_encoder)
+    except Exception:
+        print("\n=== WARMUP FAILED (will retry lazily on first request) ===")
+        print(traceback.format_exc())
+    yield
+    get_sandbox_pool().shutdown()
+
+app = FastAPI(title="Agentic RAG API", lifespan=lifespan)
 
 # CRITICAL: Configure CORS so your NextJS frontend (port 3000) can talk to this backend (port 8000)
 app.add_middleware(
@@ -23,53 +63,243 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Opens a trace per request, records its latency and optionally profiles it if it turns out slow."""
+    trace = start_trace()
+    start = time.perf_counter()
+    with maybe_profile(trace.trace_id) as profile:
+        response = await call_next(request)
+    elapsed = time.perf_counter() - start
+
+    # Label by route template (e.g. /api/ingest/{job_id}) to keep metric cardinality bounded
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    response.headers["X-Trace-Id"] = trace.trace_id
+    if response.headers.get("content-type", "").startswith("text/event-stream"):
+        # The headers go out as soon as the stream opens, so the latency is recorded once the last event is sent
+        response.headers["Server-Timing"] = f"headers;dur={elapsed * 1000:.1f}"
+        response.body_iterator = _observe_when_done(response.body_iterator, start, route, response.status_code)
+    else:
+        METRICS.observe("rag_http_request_duration_seconds", elapsed, route=route, status=response.status_code)
+        response.headers["Server-Timing"] = f"total;dur={elapsed * 1000:.1f}"
+    if profile["profile"]:
+        print(f"[profiler] slow request {route} ({elapsed * 1000:.0f} ms) -> {profile['profile']}")
+    return response
+
+async def _observe_when_done(body, start: float, route: str, status: int):
+    try:
+        async for chunk in body:
+            yield chunk
+    finally:
+        METRICS.observe("rag_http_request_duration_seconds", time.perf_counter() - start, route=route, status=status)
+
+def _limiter_gauges():
+    for name, limiter in (("chat", chat_limiter), ("ingest", ingest_limiter)):
+        for field, value in limiter.stats().items():
+            yield f"rag_limiter_{field}", value, {"endpoint": name}
+    for field, value in get_sandbox_pool().stats().items():
+        yield f"rag_sandbox_{field}", value, {}
+    for field, value in get_answer_cache().stats().items():
+        if isinstance(value, (int, float)):
+            yield f"rag_answer_cache_{field}", value, {}
+
+METRICS.register_collector(_limiter_gauges)
+
 # Define the expected JSON payload for chat
 class ChatRequest(BaseModel):
     message: str
+    # Omit to start a new conversation; the reply carries the id to send with follow-up turns
+    session_id: Optional[str] = None
+    # Selects the user's private USER_MEMORY.md; defaults to the session owner, or the shared default user
+    user_id: Optional[str] = Field(default=None, pattern=r"^[A-Za-z0-9_-][A-Za-z0-9_.-]{0,63}$")
+    # Adds a per-span timing breakdown (agent steps, tools, LLM tokens) to the response
+    include_timings: bool = False
 
-@app.post("/api/ingest")
-async def ingest_files(files: List[UploadFile] = File(...)):
-    """Receives multiple files, processes them, and indexes them."""
-    try:
-        temp_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "temp_uploads")
-        os.makedirs(temp_dir, exist_ok=True)
-        
-        total_chunks = 0
-        processed_files = []
-
-        for file in files:
-            file_path = os.path.join(temp_dir, file.filename)
+@app.get("/api/ready")
+async def ready():
+    """Readiness probe: 200 once the shared embedding model and vector store are loaded."""
+    status = runtime_status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """Hit/miss counters for the query-embedding, retrieval result and semantic answer caches."""
+    return {**retrieval_cache_stats(), "answers": get_answer_cache().stats()}
+
+@app.get("/api/index/stats")
+async def index_stats():
+    """Vector index backend, size and (for the compressed backend) memory saved versus float32."""
+    return await run_in_threadpool(lambda: get_vector_index().stats())
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint: span/LLM/HTTP histograms and counters plus cache and limiter gauges."""
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/concurrency")
+async def concurrency_stats():
+    """Live admission-control counters per endpoint."""
+    return {"chat": chat_limiter.stats(), "ingest": ingest_limiter.stats(), "sandbox": get_sandbox_pool().stats()}
+
+def _parse_tags(tags: str) -> list:
+    return [tag.strip() for tag in tags.split(",") if tag.strip()]
+
+def _stage_uploads(files: List[UploadFile]) -> list:
+    """Copies uploads to temp_uploads so the background job can read them after the request closes."""
+    staging_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "temp_uploads", uuid.uuid4().hex)
+    os.makedirs(staging_dir, exist_ok=True)
+
+    staged = []
+    for i, file in enumerate(files):
+        # Prefix with the position so two uploads with the same name don't overwrite each other
+        file_path = os.path.join(staging_dir, f"{i:05d}_{os.path.basename(file.filename)}")
+        with open(file_path, "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+        staged.append((file_path, file.filename))
+    return staged
+
+@app.post("/api/ingest", status_code=202)
+async def ingest_files(files: List[UploadFile] = File(...), tags: str = Form("")):
+    """
+    Receives multiple files and queues them for background indexing; poll /api/ingest/{job_id} for progress.
+    `tags` is an optional comma-separated list stamped on every chunk for filtered search.
+    """
+    async with ingest_limiter.slot():
+        try:
+            staged = await run_blocking(INGEST_EXECUTOR, _stage_uploads, files)
+            job = submit_job(staged, tags=_parse_tags(tags))
+            return {"status": "accepted", "job_id": job.id, "files": [filename for _, filename in staged]}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/ingest/stream", status_code=202)
+async def ingest_stream(request: Request, filename: str = Query(...), tags: str = Query("")):
+    """
+    Raw-body upload of a single file (Content-Type: application/octet-stream).
+    The body is streamed block by block into one staging file, skipping the multipart spool and second copy,
+    and the job parses it page by page; memory stays bounded whatever the file size.
+    """
+    async with ingest_limiter.slot():
+        staging_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "temp_uploads", uuid.uuid4().hex)
+        os.makedirs(staging_dir, exist_ok=True)
+        file_path = os.path.join(staging_dir, os.path.basename(filename))
+        try:
             with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-                
-            # Pass to our upgraded document parser
-            result = ingest_document(file_path, file.filename)
-            
+                async for block in request.stream():
+                    await run_blocking(INGEST_EXECUTOR, buffer.write, block)
+            job = submit_job([(file_path, filename)], tags=_parse_tags(tags))
+            return {"status": "accepted", "job_id": job.id, "files": [filename]}
+        except Exception as e:
             if os.path.exists(file_path):
                 os.remove(file_path)
-                
-            if result.get("status") == "success":
-                total_chunks += result.get("chunks_indexed", 0)
-                processed_files.append(file.filename)
-            
-        return {"status": "success", "processed_files": processed_files, "total_chunks": total_chunks}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+            raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/ingest/{job_id}")
+async def ingest_status(job_id: str):
+    """Per-file progress and throughput (chunks/s) of an ingestion job."""
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown ingestion job: {job_id}")
+    return job.to_dict()
+
+async def _open_conversation(request: ChatRequest):
+    """Loads the request's session (or starts one) and checks that it belongs to the requesting user."""
+    store = get_conversation_store()
+    if request.session_id is None:
+        user_id = request.user_id or DEFAULT_USER_ID
+        session_id = await run_in_threadpool(store.create, user_id)
+        return get_session(session_id, user_id)
+
+    conversation = await run_in_threadpool(store.get, request.session_id)
+    if conversation is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired session: {request.session_id}")
+    if request.user_id is not None and request.user_id != conversation["user_id"]:
+        raise HTTPException(status_code=403, detail="Session belongs to a different user.")
+    return get_session(request.session_id, conversation["user_id"])
+
+async def _begin_turn(session, message: str) -> tuple:
+    """(agent inputs, stored history length) for the next turn: summary, valid memory snapshot, history, new message."""
+    await wait_for_compaction(session)
+    activate_session(session)
+    conversation = await run_in_threadpool(get_conversation_store().get, session.session_id)
+    snapshot = await run_in_threadpool(memory_snapshot, session)
+    return {"messages": build_messages(conversation, message, snapshot)}, len(conversation["messages"])
+
+async def _end_turn(session, message: str, reply: str, history_length: int) -> None:
+    await run_in_threadpool(get_conversation_store().append, session.session_id, [("user", message), ("assistant", reply)])
+    if history_length + 2 > CONVERSATION_MAX_MESSAGES:
+        schedule_compaction(session, llm)
+
+def _cached_answer(session, message: str, history_length: int):
+    """
+    A stored answer to a near-identical question, or None. Only first turns are served from the cache:
+    later turns can lean on the conversation ("what about its budget?") in ways the embedding can't see.
+    """
+    if not ANSWER_CACHE_ENABLED or history_length:
+        return None
+    return get_answer_cache().lookup(session.user_id, embed_query(message), memory_signature(session.user_id))
+
+def _remember_answer(session, message: str, reply: str, history_length: int, latency_s: float) -> None:
+    if ANSWER_CACHE_ENABLED and not history_length:
+        get_answer_cache().store(
+            session.user_id, message, embed_query(message), reply, memory_signature(session.user_id), latency_s
+        )
+
+@app.get("/api/sessions/{session_id}")
+async def session_history(session_id: str):
+    """Rolling summary and the recent messages still kept verbatim for a session."""
+    conversation = await run_in_threadpool(get_conversation_store().get, session_id)
+    if conversation is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired session: {session_id}")
+    return {
+        "session_id": session_id,
+        "user_id": conversation["user_id"],
+        "summary": conversation["summary"],
+        "messages": [{"role": role, "content": content} for _, role, content in conversation["messages"]],
+    }
+
+@app.delete("/api/sessions/{session_id}")
+async def delete_session(session_id: str):
+    await run_in_threadpool(get_conversation_store().delete, session_id)
+    drop_session(session_id)
+    return {"status": "deleted", "session_id": session_id}
 
 @app.post("/api/chat")
 async def chat(request: ChatRequest):
+    async with chat_limiter.slot():
+        return await _chat(request)
+
+async def _chat(request: ChatRequest):
+    session = await _open_conversation(request)
     try:
-        inputs = {"messages": [("user", request.message)]}
-        response = agent_executor.invoke(inputs)
-        
-        final_message = response["messages"][-1].content
-        
-        if isinstance(final_message, list):
-            final_message = "".join(
-                block["text"] for block in final_message if isinstance(block, dict) and "text" in block
-            )
-        
-        return {"reply": final_message}
+        async with session.lock:
+            inputs, history_length = await _begin_turn(session, request.message)
+            trace = current_trace()
+            hit = await run_in_threadpool(_cached_answer, session, request.message, history_length)
+            if hit is not None:
+                final_message = hit["reply"]
+            else:
+                started = time.perf_counter()
+                # ainvoke keeps the event loop free: the LLM call is async and sync tools run in a thread pool
+                response = await agent_executor.ainvoke(inputs, config={"callbacks": [TracingCallbackHandler(trace)]})
+
+                final_message = response["messages"][-1].content
+
+                if isinstance(final_message, list):
+                    final_message = "".join(
+                        block["text"] for block in final_message if isinstance(block, dict) and "text" in block
+                    )
+                await run_in_threadpool(
+                    _remember_answer, session, request.message, final_message, history_length, time.perf_counter() - started
+                )
+            await _end_turn(session, request.message, final_message, history_length)
+
+        body = {"reply": final_message, "session_id": session.session_id}
+        if hit is not None:
+            body["cached"] = {"similarity": hit["similarity"], "matched": hit["matched"]}
+        if request.include_timings and trace is not None:
+            body["timings"] = trace.breakdown()
+        return body
     except Exception as e:
         # FIX: Print the exact error to the terminal so we can debug it
         print("\n=== FASTAPI CRASH LOG ===")
@@ -77,7 +307,76 @@ async def chat(request: ChatRequest):
         print("=========================\n")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _cached_events(hit: dict):
+    """Replays a cached answer in the shape of stream_agent_events: citations, the whole reply as one token, done."""
+    citations = extract_citations(hit["reply"])
+    if citations:
+        yield "citations", {"citations": citations}
+    yield "token", {"text": hit["reply"]}
+    yield "done", {"reply": hit["reply"], "cached": {"similarity": hit["similarity"], "matched": hit["matched"]}}
+
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Same agent loop as /api/chat, streamed as Server-Sent Events (token, tool_start, tool_end, citations, done)."""
+    # Admit (or 429) before the response starts; the slot is held until the stream ends
+    await chat_limiter.acquire()
+    released = False
+
+    def release_slot():
+        nonlocal released
+        if not released:
+            released = True
+            chat_limiter.release()
+
+    try:
+        session = await _open_conversation(request)
+    except Exception:
+        release_slot()
+        raise
+
+    trace = current_trace()
+    config = {"callbacks": [TracingCallbackHandler(trace)]}
+
+    async def event_source():
+        try:
+            async with session.lock:
+                inputs, history_length = await _begin_turn(session, request.message)
+                hit = await run_in_threadpool(_cached_answer, session, request.message, history_length)
+                if hit is not None:
+                    events = _cached_events(hit)
+                else:
+                    events = stream_agent_events(agent_executor, inputs, config=config)
+                started = time.perf_counter()
+                async for event, data in events:
+                    if event == "done":
+                        if hit is None:
+                            await run_in_threadpool(
+                                _remember_answer, session, request.message, data["reply"], history_length, time.perf_counter() - started
+                            )
+                        await _end_turn(session, request.message, data["reply"], history_length)
+                        data = {**data, "session_id": session.session_id}
+                        if request.include_timings and trace is not None:
+                            data["timings"] = trace.breakdown()
+                    yield format_sse(event, data)
+        except Exception as e:
+            print("\n=== FASTAPI STREAM CRASH LOG ===")
+            print(traceback.format_exc())
+            print("================================\n")
+            yield format_sse("error", {"detail": str(e)})
+        finally:
+            release_slot()
+
+    return StreamingResponse(
+        event_source(),
+        # Also released after the response: a client gone before the first chunk means the generator never ran
+        background=BackgroundTask(release_slot),
+        media_type="text/event-stream",
+        # Stop proxies from buffering the stream, which would defeat the point
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Session-Id": session.session_id},
+    )
+
 if __name__ == "__main__":
     import uvicorn
-    # Run the server on port 8000
-    uvicorn.run("backend.main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    # Run the server on port 8000. API_WORKERS > 1 runs one process per worker (reload is dev-only)
+    workers = int(os.getenv("API_WORKERS", "1"))
+    uvicorn.run("backend.main:app", host="0.0.0.0", port=8000, reload=workers == 1, workers=workers)
\ No newline at end of file
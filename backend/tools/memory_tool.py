@@ -1,13 +1,46 @@
 # Feature B: Markdown memory writers (placeholder)
 
 import os
+from typing import Optional
 from langchain_core.tools import tool
 from pydantic import BaseModel, Field
 
+from backend.core.conversations import DEFAULT_USER_ID, current_session, current_user_id
+from backend.core.memory_store import MEMORY_TOP_N, get_memory_store
+
 # Define absolute paths to the root directory where the judges expect the markdown files
 ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 USER_MEMORY_PATH = os.path.join(ROOT_DIR, "USER_MEMORY.md")
 COMPANY_MEMORY_PATH = os.path.join(ROOT_DIR, "COMPANY_MEMORY.md")
+# Every user except the default one gets a private USER_MEMORY.md; COMPANY_MEMORY.md is shared
+USER_MEMORY_DIR = os.path.join(ROOT_DIR, "memory", "users")
+
+def user_memory_path(user_id: str) -> str:
+    if not user_id or user_id == DEFAULT_USER_ID:
+        return USER_MEMORY_PATH
+    return os.path.join(USER_MEMORY_DIR, user_id, "USER_MEMORY.md")
+
+def memory_files(user_id: str = None) -> dict:
+    """(path, label) per memory target for `user_id` (default: the user of the current chat session)."""
+    user_id = user_id or current_user_id()
+    return {"USER": (user_memory_path(user_id), "USER"), "COMPANY": (COMPANY_MEMORY_PATH, "COMPANY")}
+
+def memory_signature(user_id: str = None) -> tuple:
+    return tuple(get_memory_store(path, label).signature() for path, label in memory_files(user_id).values())
+
+def memory_snapshot(session) -> Optional[str]:
+    """
+    Every stored fact, for the prompt of a session that has already called get_memory, or None.
+    Only offered while no file holds more than MEMORY_TOP_N entries: a query-ranked excerpt from an earlier
+    turn may miss what the new question needs, so larger memories are fetched with get_memory each turn.
+    """
+    if session.latest("memory") is None:
+        return None
+    files = memory_files(session.user_id)
+    if any(len(get_memory_store(path, label).entries()) > MEMORY_TOP_N for path, label in files.values()):
+        return None
+    signature = memory_signature(session.user_id)
+    return session.cached("memory", ("", signature), lambda: (signature, _render_memory(None, session.user_id)))[1]
 
 # We use Pydantic to force the LLM to output the exact decision structure requested by the judges
 class MemoryInput(BaseModel):
@@ -32,41 +65,40 @@ def save_memory(should_write: bool, target: str, summary: str, confidence: float
     if target.upper() not in ["USER", "COMPANY"]:
         return "Memory bypassed: Invalid target. Must be USER or COMPANY."
 
-    # Determine which file to write to
-    file_path = USER_MEMORY_PATH if target.upper() == "USER" else COMPANY_MEMORY_PATH
-    
-    # Ensure the files exist
-    if not os.path.exists(file_path):
-        with open(file_path, "w") as f:
-            f.write(f"# {target.upper()} MEMORY\n\n")
-
-# Append the memory
+    store = get_memory_store(*memory_files()[target.upper()])
     try:
-        with open(file_path, "a") as f:
-            # Added a leading newline to ensure it breaks away from any existing comments
-            f.write(f"\n- {summary}\n")
-        return f"Successfully saved memory to {target}_MEMORY.md: '{summary}'"
+        if not store.add(summary):
+            return f"Memory already known in {target.upper()}_MEMORY.md: '{summary}'"
+        return f"Successfully saved memory to {target.upper()}_MEMORY.md: '{summary}'"
     except Exception as e:
         return f"System Error: Failed to save memory: {str(e)}"
-    
-@tool("get_memory")
-def get_memory() -> str:
+
+class GetMemoryInput(BaseModel):
+    query: Optional[str] = Field(
+        default=None,
+        description="The user's current question. When given, only the most relevant stored facts are returned.",
+    )
+
+@tool("get_memory", args_schema=GetMemoryInput)
+def get_memory(query: Optional[str] = None) -> str:
     """
-    Retrieves all stored high-signal knowledge from both USER and COMPANY memory files.
+    Retrieves stored high-signal knowledge from the USER and COMPANY memory files.
     Always call this at the start of a session or when needing context on user preferences.
+    Pass the user's question as `query` to get the most relevant facts first.
     """
-    memories = []
-    
-    for path, label in [(USER_MEMORY_PATH, "USER"), (COMPANY_MEMORY_PATH, "COMPANY")]:
-        if os.path.exists(path):
-            try:
-                with open(path, "r") as f:
-                    content = f.read().strip()
-                    if content:
-                        memories.append(f"--- {label} MEMORY ---\n{content}")
-            except Exception as e:
-                memories.append(f"Error reading {label} memory: {str(e)}")
-        else:
-            memories.append(f"--- {label} MEMORY ---\n(Empty: No facts stored yet)")
+    session = current_session()
+    if session is None:
+        return _render_memory(query)
+    # Reused for the rest of the session until a memory file changes
+    signature = memory_signature(session.user_id)
+    key = (" ".join((query or "").lower().split()), signature)
+    return session.cached("memory", key, lambda: (signature, _render_memory(query)))[1]
 
-    return "\n\n".join(memories)
\ No newline at end of file
+def _render_memory(query: Optional[str], user_id: str = None) -> str:
+    memories = []
+    for path, label in memory_files(user_id).values():
+        try:
+            memories.append(get_memory_store(path, label).render(query))
+        except Exception as e:
+            memories.append(f"Error reading {label} memory: {str(e)}")
+    return "\n\n".join(memories)
@@ -1,12 +1,11 @@
 # backend/tools/sandbox_tool.py
-import sys
-import pandas as pd
-import requests    
 import re
-from io import StringIO
 from langchain_core.tools import tool
 from datetime import datetime
 
+from backend.core.sandbox_pool import get_sandbox_pool
+from backend.core.tracing import span
+
 # SECURITY GUARD: Patterns that could be used for sandbox escapes or file system access
 FORBIDDEN_PATTERNS = [
     r"import\s+os", r"import\s+subprocess", r"import\s+sys", r"import\s+shutil",
@@ -23,27 +22,15 @@ def execute_python(code: str) -> str:
         if re.search(pattern, code, re.IGNORECASE):
             return f"SECURITY_ERROR: The command matching '{pattern}' is restricted."
 
-    old_stdout = sys.stdout
-    redirected_output = sys.stdout = StringIO()
-    
-    try:
-        # Pre-loading the modules into the environment so the agent doesn't have to import them
-        exec_globals = {
-            "pd": pd,
-            "requests": requests,
-            "print": print,
-            "math": __import__('math'),
-            "datetime": __import__('datetime'),
-            # EXPLICIT DATE INJECTION
-            "CURRENT_DATE": datetime.now().strftime("%Y-%m-%d"),
-            "__builtins__": __builtins__
-        }
-        
-        exec(code, exec_globals)
-        
-        output = redirected_output.getvalue()
+    # Runs in a pooled worker process: its own stdout, CPU/memory limits, and a hard timeout
+    with span("sandbox.exec"):
+        result = get_sandbox_pool().run(code, current_date=datetime.now().strftime("%Y-%m-%d"))
+
+    output = result.get("output", "")
+    if result["status"] == "ok":
         return f"REAL_EXECUTION_RESULT:\n{output}" if output else "No output printed."
-    except Exception as e:
-        return f"EXECUTION_ERROR: {str(e)}"
-    finally:
-        sys.stdout = old_stdout
\ No newline at end of file
+    if result["status"] == "busy":
+        return f"SANDBOX_BUSY: {result['error']}. Try again shortly."
+    if result["status"] in ("timeout", "cpu_limit", "memory_limit"):
+        return f"EXECUTION_ERROR: {result['error']}. Use smaller date ranges or vectorised pandas operations."
+    return f"EXECUTION_ERROR: {result['error']}"
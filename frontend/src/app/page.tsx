@@ -23,6 +23,8 @@ export default function TerminalUI() {
   ]);
   const [inputValue, setInputValue] = useState("");
   const [isProcessing, setIsProcessing] = useState(false);
+  // Server-side conversation id, returned by the first reply and sent with every follow-up
+  const sessionIdRef = useRef<string | null>(null);
 
   // --- Refs ---
   const bottomRef = useRef<HTMLDivElement>(null);
@@ -69,12 +71,16 @@ export default function TerminalUI() {
         const response = await fetch("http://localhost:8000/api/chat", {
           method: "POST",
           headers: { "Content-Type": "application/json" },
-          body: JSON.stringify({ message: command }),
+          body: JSON.stringify({
+            message: command,
+            session_id: sessionIdRef.current,
+          }),
         });
 
         if (!response.ok) throw new Error("Chat request failed");
 
         const data = await response.json();
+        sessionIdRef.current = data.session_id ?? sessionIdRef.current;
 
         // Replace the temporary message with the actual agent response
         setHistory((prev) =>
@@ -128,14 +134,25 @@ export default function TerminalUI() {
 
       if (!response.ok) throw new Error("Ingestion failed");
 
-      const data = await response.json();
+      // Indexing runs as a background job; poll until it finishes
+      const { job_id } = await response.json();
+      let job;
+      do {
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        const statusResponse = await fetch(`http://localhost:8000/api/ingest/${job_id}`);
+        if (!statusResponse.ok) throw new Error("Ingestion status failed");
+        job = await statusResponse.json();
+      } while (job.status === "queued" || job.status === "running");
 
+      if (job.status === "failed") throw new Error("Ingestion failed");
+
+      const failures = job.status === "completed_with_errors" ? ` ${job.files_failed} file(s) failed to index.` : "";
       setHistory((prev) => [
         ...prev,
         {
           id: Date.now().toString(),
           role: "system",
-          content: `Success: Processed ${files.length} file(s). ${data.total_chunks} total chunks indexed.`,
+          content: `Success: Processed ${job.files_done} file(s). ${job.chunks_indexed} total chunks indexed (${job.chunks_per_s} chunks/s).${failures}`,
         },
       ]);
     } catch (error) {
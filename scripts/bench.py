@@ -0,0 +1,411 @@
+"""
+Benchmark harness: ingestion throughput, retrieval latency/recall and end-to-end /api/chat.
+
+Generates a synthetic corpus with planted facts (gold citations), indexes it into a throwaway
+vector store and writes a JSON report that can be compared across commits:
+
+    make bench
+    python scripts/bench.py --docs 200 --queries 100 --output artifacts/bench/my_run.json
+    python scripts/bench.py --sandbox-only    # execute_python analytics against the recorded HTTP fixtures
+    python scripts/bench.py --lexical-only --lexical-chunks 1000000    # BM25 search latency at 1M chunks
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+# Sample analytics programs; the HTTP responses they need are recorded under fixtures/http
+SANDBOX_QUERIES = ROOT_DIR / "fixtures" / "sandbox_queries.json"
+
+WORDS = (
+    "pipeline latency throughput forecast revenue analyst portfolio compliance vendor contract "
+    "integration dashboard quarterly strategy infrastructure deployment migration security audit "
+    "budget milestone stakeholder roadmap capacity telemetry storage replication benchmark"
+).split()
+
+
+# --- Synthetic corpus ---
+def generate_corpus(out_dir: Path, docs: int, paragraphs: int, seed: int) -> list:
+    """
+    Writes `docs` text files of filler paragraphs, each with one planted fact.
+    Returns gold questions: {"question", "source", "snippet"} in EVAL_QUESTIONS.md style.
+    """
+    rng = random.Random(seed)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    gold = []
+    for d in range(docs):
+        name = f"Synthetic_Project_{d:04d}.txt"
+        project = f"Project {rng.choice(WORDS).title()}-{d:04d}"
+        goal = f"{rng.uniform(1, 40):.1f}%"
+        fact = f"The specific latency reduction goal for {project} is exactly {goal}."
+        fact_at = rng.randrange(paragraphs)
+        body = []
+        for p in range(paragraphs):
+            filler = " ".join(rng.choice(WORDS) for _ in range(rng.randint(60, 110))).capitalize() + "."
+            body.append(f"{filler} {fact}" if p == fact_at else filler)
+        (out_dir / name).write_text(f"{project} Specification\n\n" + "\n\n".join(body), encoding="utf-8")
+        gold.append({
+            "question": f"What is the specific latency reduction goal for {project}?",
+            "source": name,
+            "snippet": f"{project} is exactly {goal}",
+        })
+    return gold
+
+
+def percentiles(samples: list) -> dict:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(p):
+        return round(ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.mean(ordered) * 1000, 3),
+        "p50_ms": pick(50),
+        "p95_ms": pick(95),
+        "p99_ms": pick(99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+# --- Ingestion ---
+def bench_ingest(corpus_dir: Path) -> dict:
+    from backend.ingest.pipeline import run_job
+
+    files = sorted(corpus_dir.glob("*.txt"))
+    report = run_job([(str(path), path.name) for path in files])
+    resync_start = time.perf_counter()
+    resync = run_job([(str(path), path.name) for path in files])
+    return {
+        "files": len(files),
+        "chunks_indexed": report["chunks_indexed"],
+        "elapsed_s": report["elapsed_s"],
+        "chunks_per_s": report["chunks_per_s"],
+        "files_per_s": round(len(files) / report["elapsed_s"], 2) if report["elapsed_s"] else None,
+        "unchanged_resync_s": round(time.perf_counter() - resync_start, 3),
+        "unchanged_resync_files_skipped": resync["files_unchanged"],
+    }
+
+
+# --- Retrieval ---
+def bench_retrieval(gold: list, k: int, modes: list) -> dict:
+    from backend.core.streaming import extract_citations
+    from backend.tools.rag_tool import retrieve_context, clear_retrieval_cache
+    from backend.core.vector_index import get_vector_index
+
+    # chunk ids holding each gold snippet, looked up once so recall is measured against real chunks
+    vector_index = get_vector_index()
+    gold_chunks = []
+    for item in gold:
+        ids = []
+        for offset in range(0, vector_index.count(), 5000):
+            page = vector_index.page(offset, 5000)
+            ids += [
+                chunk_id for chunk_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"])
+                if (metadata or {}).get("source") == item["source"] and item["snippet"] in text
+            ]
+        gold_chunks.append(set(ids))
+
+    results = {}
+    for mode in modes:
+        # "hybrid+rerank" = hybrid first stage, cross-encoder second stage with adaptive k
+        base_mode, _, stage = mode.partition("+")
+        options = {"mode": base_mode, "rerank_results": stage == "rerank"}
+        clear_retrieval_cache()
+        cold, warm, hits, returned = [], [], 0, []
+        for item, expected in zip(gold, gold_chunks):
+            start = time.perf_counter()
+            context = retrieve_context(item["question"], k=k, **options)
+            cold.append(time.perf_counter() - start)
+            found = {citation["chunk_id"] for citation in extract_citations(context)}
+            hits += bool(found & expected)
+            returned.append(len(found))
+        for item in gold:
+            start = time.perf_counter()
+            retrieve_context(item["question"], k=k, **options)
+            warm.append(time.perf_counter() - start)
+        results[mode] = {
+            f"recall@{k}": round(hits / len(gold), 4) if gold else None,
+            "avg_chunks_returned": round(statistics.mean(returned), 2) if returned else None,
+            "latency_uncached": percentiles(cold),
+            "latency_cached": percentiles(warm),
+        }
+    return results
+
+
+# --- Vector compression ---
+def bench_compression(gold: list, k: int, quantizations: list) -> dict:
+    """Memory saved and recall lost by int8/float16 vectors, measured on the indexed corpus against exact float32."""
+    import numpy as np
+    from backend.core.vector_index import get_vector_index, measure_compression
+    from backend.tools.rag_tool import embed_query
+
+    vector_index = get_vector_index()
+    vectors = []
+    for offset in range(0, vector_index.count(), 5000):
+        ids = vector_index.page(offset, 5000)["ids"]
+        embeddings = vector_index.get_embeddings(ids)
+        vectors += [embeddings[chunk_id] for chunk_id in ids if chunk_id in embeddings]
+    queries = [embed_query(item["question"]) for item in gold]
+    return {
+        quantization: measure_compression(np.asarray(vectors), np.asarray(queries), k, quantization)
+        for quantization in quantizations
+    }
+
+
+# --- Keyword index at scale ---
+def bench_lexical(index_path: Path, chunks: int, queries: int, k: int, seed: int) -> dict:
+    """
+    Fills a standalone BM25 index with `chunks` synthetic chunks over a Zipf-distributed vocabulary (no model,
+    no vector store) and times LexicalIndex.search on questions about planted IDs and on common-words-only queries, with and
+    without a source filter.
+    """
+    from backend.core.lexical_index import LexicalIndex
+
+    rng = random.Random(seed)
+    vocabulary = WORDS + [f"{rng.choice(WORDS)[:4]}{n:x}" for n in range(50000)]
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+    index = LexicalIndex(str(index_path))
+    planted = []
+    fill_start = time.perf_counter()
+    for offset in range(0, chunks, 10000):
+        batch = []
+        for n in range(offset, min(offset + 10000, chunks)):
+            text = " ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=120))
+            if n % 1000 == 0:
+                planted.append(f"SEC-{n}")
+                text += f" Control SEC-{n} requires {rng.uniform(1, 40):.1f}% coverage."
+            batch.append((f"chunk_{n}", f"Synthetic_{n // 200:05d}.txt", text))
+        index.upsert(batch)
+    fill_s = time.perf_counter() - fill_start
+
+    samples = {"planted_id": [], "common_words": [], "common_words_in_source": []}
+    for _ in range(queries):
+        for kind, query, source in (
+            ("planted_id", f"What coverage does control {rng.choice(planted)} require?", None),
+            ("common_words", " ".join(rng.sample(WORDS, 3)), None),
+            ("common_words_in_source", " ".join(rng.sample(WORDS, 3)), f"Synthetic_{rng.randrange(max(chunks // 200, 1)):05d}.txt"),
+        ):
+            start = time.perf_counter()
+            index.search(query, k=k, source=source)
+            samples[kind].append(time.perf_counter() - start)
+    return {
+        "chunks": index.count(),
+        "fill_s": round(fill_s, 2),
+        "index_mb": round(index_path.stat().st_size / 1e6, 1),
+        **{f"search_{kind}": percentiles(latencies) for kind, latencies in samples.items()},
+    }
+
+
+# --- End-to-end chat with a stub LLM ---
+def build_stub_agent(latency_ms: float):
+    """The production agent graph and tools, with ChatGroq replaced by a deterministic local model."""
+    from langchain.agents import create_agent
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+    from langchain_core.outputs import ChatGeneration, ChatResult
+    from backend.core.graph import tools, AGENT_MIDDLEWARE
+    from backend.core.prompts import SYSTEM_PROMPT
+    from backend.core.streaming import extract_citations
+
+    class StubChatModel(BaseChatModel):
+        """Calls search_documents for the user's question, then answers with the first citation."""
+
+        latency_s: float = 0.0
+
+        @property
+        def _llm_type(self) -> str:
+            return "bench-stub"
+
+        def bind_tools(self, tools, **kwargs):
+            return self
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            time.sleep(self.latency_s)
+            # The prefetch middleware may have appended a system message after the question
+            results = [m for m in messages if isinstance(m, ToolMessage)]
+            if not results:
+                question = next(m for m in reversed(messages) if isinstance(m, HumanMessage))
+                call = {"name": "search_documents", "args": {"query": question.content}, "id": f"call_{len(messages)}"}
+                message = AIMessage(content="", tool_calls=[call])
+            else:
+                citations = extract_citations(results[-1].content)
+                cite = f" [Source: {citations[0]['source']}, Chunk: {citations[0]['chunk_id']}]" if citations else ""
+                message = AIMessage(content=f"Stub answer based on the documents.{cite}")
+            return ChatResult(generations=[ChatGeneration(message=message)])
+
+    return create_agent(
+        StubChatModel(latency_s=latency_ms / 1000), tools=tools, system_prompt=SYSTEM_PROMPT, middleware=AGENT_MIDDLEWARE
+    )
+
+
+def bench_chat(gold: list, requests_count: int, latency_ms: float) -> dict:
+    from fastapi.testclient import TestClient
+    import backend.main as api
+
+    api.agent_executor = build_stub_agent(latency_ms)
+    questions = [item["question"] for item in gold[:requests_count]]
+    blocking, first_byte, errors = [], [], 0
+    with TestClient(api.app) as client:
+        for question in questions:
+            start = time.perf_counter()
+            response = client.post("/api/chat", json={"message": question})
+            blocking.append(time.perf_counter() - start)
+            errors += response.status_code != 200
+
+            start = time.perf_counter()
+            with client.stream("POST", "/api/chat/stream", json={"message": question}) as stream:
+                for _ in stream.iter_bytes():
+                    first_byte.append(time.perf_counter() - start)
+                    break
+                for _ in stream.iter_bytes():
+                    pass
+    return {
+        "requests": len(questions),
+        "errors": errors,
+        "stub_llm_latency_ms": latency_ms,
+        "chat_latency": percentiles(blocking),
+        "stream_time_to_first_byte": percentiles(first_byte),
+    }
+
+
+# --- Sandbox analytics, offline ---
+def bench_sandbox(runs: int, http_mode: str) -> dict:
+    """
+    Runs each sample analytics program `runs` times on a fresh sandbox pool. In replay mode every HTTP call
+    is served from fixtures/http, so a missing fixture fails the run instead of reaching the network;
+    record mode re-records the fixtures from the live API.
+    """
+    # Read by the workers at startup, so it must be set before the pool starts them
+    os.environ["SANDBOX_HTTP_MODE"] = http_mode
+    from backend.core.sandbox_pool import SandboxPool
+
+    queries = json.loads(SANDBOX_QUERIES.read_text(encoding="utf-8"))
+    pool = SandboxPool()
+    latencies, failures = [], []
+    try:
+        pool.start()
+        for query in queries:
+            for _ in range(runs):
+                start = time.perf_counter()
+                result = pool.run(query["code"], current_date=query["current_date"])
+                latencies.append(time.perf_counter() - start)
+                if result["status"] != "ok" or query["expect"] not in result["output"]:
+                    failures.append({"question": query["question"], "status": result["status"], "error": result.get("error")})
+        stats = pool.stats()
+    finally:
+        pool.shutdown()
+    return {
+        "http_mode": http_mode,
+        "programs": len(queries),
+        "runs": len(latencies),
+        "failures": failures,
+        "http_replayed": stats["http_replayed"],
+        "http_cache_misses": stats["http_cache_misses"],
+        "latency": percentiles(latencies),
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=50, help="synthetic documents to generate")
+    parser.add_argument("--paragraphs", type=int, default=12, help="paragraphs per document")
+    parser.add_argument("--queries", type=int, default=50, help="gold questions to run (<= docs)")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--modes", default="vector,hybrid", help="retrieval modes to compare, e.g. vector,hybrid,hybrid+rerank")
+    parser.add_argument("--quantization", default="int8,float16", help="vector compressions to evaluate ('' skips)")
+    parser.add_argument("--chat-requests", type=int, default=20, help="0 skips the /api/chat benchmark")
+    parser.add_argument("--stub-latency-ms", type=float, default=0.0, help="simulated LLM latency per call")
+    parser.add_argument("--sandbox-runs", type=int, default=3, help="runs per sample analytics program; 0 skips")
+    parser.add_argument("--sandbox-http-mode", default="replay", choices=["replay", "record"], help="replay: fixtures only; record: refresh them")
+    parser.add_argument("--sandbox-only", action="store_true", help="only run the sandbox analytics check (no corpus, no model)")
+    parser.add_argument("--lexical-chunks", type=int, default=0, help="chunks for the standalone BM25 scale check, e.g. 1000000; 0 skips")
+    parser.add_argument("--lexical-only", action="store_true", help="only run the BM25 scale check (no corpus, no model)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default=None, help="JSON report path (default: artifacts/bench/<rev>_<time>.json)")
+    parser.add_argument("--keep", action="store_true", help="keep the generated corpus and index")
+    args = parser.parse_args()
+
+    work_dir = Path(tempfile.mkdtemp(prefix="rag_bench_"))
+    # Point every store at the scratch directory before backend modules read their paths
+    os.environ["CHROMA_DB_DIR"] = str(work_dir / "index")
+    os.environ.setdefault("GROQ_API_KEY", "bench-not-used")
+
+    try:
+        report = {
+            "revision": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "config": vars(args),
+        }
+        if args.sandbox_only:
+            report["sandbox"] = bench_sandbox(max(args.sandbox_runs, 1), args.sandbox_http_mode)
+            print(json.dumps(report["sandbox"], indent=2))
+            if report["sandbox"]["failures"]:
+                raise SystemExit("SANDBOX_FAILED: see failures above")
+            print("SANDBOX_OK")
+            return
+
+        if args.lexical_chunks > 0 or args.lexical_only:
+            chunks = args.lexical_chunks or 100000
+            print(f"Benchmarking the BM25 index at {chunks} chunks...")
+            report["lexical"] = bench_lexical(work_dir / "lexical_scale.sqlite3", chunks, args.queries, args.k, args.seed)
+            if args.lexical_only:
+                print(json.dumps(report["lexical"], indent=2))
+                return
+
+        gold = generate_corpus(work_dir / "corpus", args.docs, args.paragraphs, args.seed)
+        rng = random.Random(args.seed)
+        queries = rng.sample(gold, min(args.queries, len(gold)))
+
+        print(f"Ingesting {args.docs} synthetic documents...")
+        report["ingest"] = bench_ingest(work_dir / "corpus")
+        print("Benchmarking retrieval...")
+        report["retrieval"] = bench_retrieval(queries, args.k, args.modes.split(","))
+        if args.quantization:
+            print("Measuring vector compression...")
+            report["compression"] = bench_compression(queries, args.k, args.quantization.split(","))
+        if args.chat_requests > 0:
+            print("Benchmarking /api/chat with the stub LLM...")
+            report["chat"] = bench_chat(queries, args.chat_requests, args.stub_latency_ms)
+        if args.sandbox_runs > 0:
+            print(f"Running the sample analytics programs ({args.sandbox_http_mode})...")
+            report["sandbox"] = bench_sandbox(args.sandbox_runs, args.sandbox_http_mode)
+
+        from backend.core.runtime import runtime_status
+        report["runtime"] = runtime_status()
+
+        output = Path(args.output) if args.output else ROOT_DIR / "artifacts" / "bench" / f"{report['revision']}_{time.strftime('%Y%m%d_%H%M%S')}.json"
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2))
+        print(json.dumps({key: report[key] for key in ("ingest", "retrieval", "compression", "lexical", "sandbox") if key in report}, indent=2))
+        print(f"BENCH_OK: wrote {output}")
+    finally:
+        if args.keep:
+            print(f"Kept corpus and index in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Offline indexer: bulk-ingest a directory, export/import portable snapshots and compact the stores.
+
+Runs the same pipeline as /api/ingest in-process (parsing on every core, cross-file embedding batches),
+without HTTP or temp_uploads. Point it at a data directory no running server is writing to:
+
+    python scripts/indexer.py index sample_docs --snapshot artifacts/snapshot
+    python scripts/indexer.py export artifacts/snapshot
+    CHROMA_DB_DIR=/srv/replica python scripts/indexer.py import artifacts/snapshot
+    python scripts/indexer.py compact
+"""
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+INDEXABLE_EXTENSIONS = ".pdf,.html,.txt,.md"
+
+
+def find_files(directory: Path, extensions: set) -> list:
+    """(path, filename) pairs under `directory`; the filename is the path relative to it, as uploads would name it."""
+    files = []
+    for path in sorted(directory.rglob("*")):
+        if path.is_file() and path.suffix.lower() in extensions and not path.name.startswith("."):
+            files.append((str(path), path.relative_to(directory).as_posix()))
+    return files
+
+
+def cmd_index(args) -> dict:
+    from backend.ingest.pipeline import run_job
+
+    extensions = {ext.strip().lower() for ext in args.extensions.split(",") if ext.strip()}
+    files = find_files(Path(args.directory), extensions)
+    if not files:
+        raise SystemExit(f"No {', '.join(sorted(extensions))} files under {args.directory}")
+    report = run_job(files, cleanup=False, tags=[tag.strip() for tag in args.tags.split(",") if tag.strip()])
+    report = {key: value for key, value in report.items() if key != "files" or args.verbose}
+    if args.snapshot:
+        from backend.ingest.snapshot import export_snapshot
+
+        report["snapshot"] = export_snapshot(args.snapshot)
+    return report
+
+
+def cmd_export(args) -> dict:
+    from backend.ingest.snapshot import export_snapshot
+
+    return export_snapshot(args.out)
+
+
+def cmd_import(args) -> dict:
+    from backend.ingest.snapshot import import_snapshot
+
+    return import_snapshot(args.snapshot)
+
+
+def cmd_compact(args) -> dict:
+    from backend.ingest.snapshot import compact_store
+
+    return compact_store(drop_unmanaged=args.drop_unmanaged)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default=None, help="index location (default: CHROMA_DB_DIR or backend/.chroma_data)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    index = commands.add_parser("index", help="ingest every supported file under a directory")
+    index.add_argument("directory")
+    index.add_argument("--extensions", default=INDEXABLE_EXTENSIONS, help="comma-separated file suffixes to ingest")
+    index.add_argument("--tags", default="", help="comma-separated tags stamped on every chunk")
+    index.add_argument("--workers", type=int, default=None, help="parser processes (default: all cores)")
+    index.add_argument("--snapshot", default=None, help="also export a snapshot to this directory afterwards")
+    index.add_argument("--verbose", action="store_true", help="include the per-file report")
+    index.set_defaults(run=cmd_index)
+
+    export = commands.add_parser("export", help="write a snapshot of the vectors, chunks and manifest")
+    export.add_argument("out")
+    export.set_defaults(run=cmd_export)
+
+    load = commands.add_parser("import", help="load a snapshot without re-embedding")
+    load.add_argument("snapshot")
+    load.set_defaults(run=cmd_import)
+
+    compact = commands.add_parser("compact", help="remove orphaned and duplicate chunks and resync the manifest")
+    compact.add_argument("--drop-unmanaged", action="store_true", help="also remove chunks of files the manifest has never seen")
+    compact.set_defaults(run=cmd_compact)
+
+    args = parser.parse_args()
+    # Must be set before backend modules are imported: they read these at import time
+    if args.data_dir:
+        os.environ["CHROMA_DB_DIR"] = str(Path(args.data_dir).resolve())
+    if getattr(args, "workers", None):
+        os.environ["PARSE_WORKERS"] = str(args.workers)
+
+    print(json.dumps(args.run(args), indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()